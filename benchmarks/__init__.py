@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+"""
+benchmarks
+Author: Brian Boates
+
+Benchmarks of PyMoDA on synthetic trajectories:
+    synthetic.py     | random or lattice-based trajectory generator
+    suite.py         | timed benchmarks, scaling reports saved as JSON
+    bench_read_trj.py | block vs per-line trj parsing
+"""
+import sys
+sys.dont_write_bytecode = True
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
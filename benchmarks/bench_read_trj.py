@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+bench_read_trj.py
+Author: Brian Boates
+
+Compares the block parser in file_tools.read_frame against parsing
+the atom records of a frame one line at a time
+
+Known limitation: the block parser spends most of its time in
+np.fromstring's float conversion, so it reaches the 10x target only
+for large frames (about 10x at 10k-50k atoms). At 1k atoms the fixed
+cost of each frame (header, lattice, Configuration) keeps it near 7-8x.
+"""
+import sys
+sys.dont_write_bytecode = True
+import os
+import time
+import tempfile
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import file_tools
+from atom import Atom
+from lattice import Lattice
+from configuration import Configuration
+from synthetic import write_synthetic_trj
+
+# per frame speedup asked of the block parser
+TARGET_SPEEDUP = 10.0
+
+def read_frame_per_line(trj):
+    """
+    return: Configuration | parsed one atom record at a time
+    parameters:
+        trj: file | open trj file
+    """
+    line = trj.readline()
+    if not line:
+        return None
+    lattice_vectors = [line.split(), trj.readline().split(), trj.readline().split()]
+    lattice = Lattice(*np.array(lattice_vectors, dtype=float).ravel())
+
+    configuration = Configuration(lattice=lattice)
+
+    atom_types = trj.readline().split()
+    atom_counts = np.array(trj.readline().split(), dtype=int)
+    natom = np.sum(atom_counts)
+
+    atoms = []
+    for i in xrange(natom):
+        atom_record = trj.readline().split()
+        atom_name = atom_record[0]
+        atom_position = np.array(atom_record[1:], dtype=float)
+        atoms.append(Atom(atom_name, atom_position))
+    configuration.insert_atoms(atoms)
+
+    return configuration
+
+def time_frames(read, trj_file):
+    """
+    return: float | seconds per frame
+    parameters:
+        read: function | frame parser
+        trj_file: string | name of trj file
+    """
+    nframes = 0
+    start = time.time()
+    with open(trj_file, 'r') as trj:
+        while read(trj) is not None:
+            nframes += 1
+    return (time.time() - start) / nframes
+
+
+def main():
+
+    trj_file = os.path.join(tempfile.mkdtemp(), 'bench.trj')
+    print '%8s %16s %16s %8s' % ('natom', 'per line (s)', 'block (s)', 'speedup')
+    short = []
+    for natom in [1000, 10000, 50000]:
+        write_synthetic_trj(trj_file, natom, nframes=5)
+        per_line = time_frames(read_frame_per_line, trj_file)
+        block = time_frames(file_tools.read_frame, trj_file)
+        print '%8s %16.5f %16.5f %8.1f' % (natom, per_line, block, per_line / block)
+        if per_line / block < TARGET_SPEEDUP:
+            short.append(str(natom))
+    os.remove(trj_file)
+    if short:
+        print 'below %.0fx target at natom=%s (known limitation, see above)' % (TARGET_SPEEDUP
+                                                                               ,', '.join(short))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""
+suite.py
+Author: Brian Boates
+
+Timed benchmarks of PyMoDA across system sizes. Each run is saved as a
+JSON report so it can be compared against an earlier run:
+
+    python benchmarks/suite.py --output new.json --compare old.json
+"""
+import sys
+sys.dont_write_bytecode = True
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import timeit
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import file_tools
+import result_cache
+from synthetic import SHAPES
+from synthetic import KINDS
+from synthetic import make_configuration
+from synthetic import write_synthetic_trj
+
+# atoms per benchmark: all-pairs distances are O(N^2) in time and memory
+DEFAULT_SIZES = {'read_trj': [1000, 10000, 50000]
+                ,'trj_str': [1000, 10000, 50000]
+                ,'to_trj': [1000, 10000, 50000]
+                ,'get_distances_dict': [250, 500, 1000, 2000]
+                ,'get_distances_list': [250, 500, 1000, 2000]
+                ,'wrap_coordinates': [1000, 10000, 100000]}
+
+def best_time(function, repeats=3):
+    """
+    return: float | fastest of repeats calls in seconds
+    parameters:
+        function: callable | called with no arguments
+        repeats: int | number of calls
+    """
+    times = []
+    for repeat in xrange(repeats):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+def bench_read_trj(natom, options, work_dir):
+    """
+    return: float | seconds per frame
+    """
+    trj_file = os.path.join(work_dir, 'read_%d.trj' % natom)
+    write_synthetic_trj(trj_file, natom, options['nframes'], options['kind'], options['shape'])
+    seconds = best_time(lambda: file_tools.read_trj(trj_file), options['repeats'])
+    os.remove(trj_file)
+    return seconds / options['nframes']
+
+def bench_trj_str(natom, options, work_dir):
+    """
+    return: float | seconds per configuration
+    """
+    configuration = make_configuration(natom, options['kind'], options['shape'])
+    return best_time(configuration.trj_str, options['repeats'])
+
+def bench_to_trj(natom, options, work_dir):
+    """
+    return: float | seconds per configuration
+    """
+    configuration = make_configuration(natom, options['kind'], options['shape'])
+    trj_file = os.path.join(work_dir, 'write_%d.trj' % natom)
+    seconds = best_time(lambda: configuration.to_trj(trj_file), options['repeats'])
+    os.remove(trj_file)
+    return seconds
+
+def bench_get_distances_dict(natom, options, work_dir):
+    """
+    return: float | seconds per configuration
+    """
+    configuration = make_configuration(natom, options['kind'], options['shape'])
+    return best_time(configuration.get_distances_dict, options['repeats'])
+
+def bench_get_distances_list(natom, options, work_dir):
+    """
+    return: float | seconds per configuration
+    """
+    configuration = make_configuration(natom, options['kind'], options['shape'])
+    return best_time(configuration.get_distances_list, options['repeats'])
+
+def bench_wrap_coordinates(natom, options, work_dir):
+    """
+    return: float | seconds per configuration
+    """
+    configuration = make_configuration(natom, options['kind'], options['shape'])
+    positions = configuration.get_positions() + 3.0 * np.random.randn(natom, 3)
+    def wrap():
+        configuration.set_positions(positions)
+        configuration.wrap_coordinates()
+    return best_time(wrap, options['repeats'])
+
+BENCHMARKS = {'read_trj': bench_read_trj
+             ,'trj_str': bench_trj_str
+             ,'to_trj': bench_to_trj
+             ,'get_distances_dict': bench_get_distances_dict
+             ,'get_distances_list': bench_get_distances_list
+             ,'wrap_coordinates': bench_wrap_coordinates}
+
+def scaling_exponent(sizes, seconds):
+    """
+    return: float | slope of log(seconds) against log(size), e.g. about 1
+                    for O(N) and 2 for O(N^2) (None for fewer than 2 sizes)
+    parameters:
+        sizes: list[int]
+        seconds: list[float]
+    """
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+
+def run_suite(names=None, sizes=None, nframes=3, repeats=3, kind='random', shape='cubic'
+             ,verbose=True):
+    """
+    The result cache is disabled while timing, so every analysis is
+    computed
+
+    return: dict | report with the environment and, for each benchmark,
+                   its sizes, seconds and scaling exponent
+    parameters:
+        names: list[string] | benchmarks to run (default: all of BENCHMARKS)
+        sizes: dict[string:list[int]] | atoms per benchmark (default: DEFAULT_SIZES)
+        nframes: int | frames per trj file for read_trj
+        repeats: int | timings per size, the fastest is kept
+        kind: string | 'random' or 'lattice' configurations
+        shape: string | cell shape, see synthetic.SHAPES
+        verbose: bool | print each timing
+    """
+    names = names or sorted(BENCHMARKS)
+    sizes = sizes or DEFAULT_SIZES
+    options = {'nframes': nframes, 'repeats': repeats, 'kind': kind, 'shape': shape}
+    cache = result_cache.get_cache()
+    result_cache.disable_cache()
+    work_dir = tempfile.mkdtemp()
+
+    report = {'created': time.strftime('%Y-%m-%d %H:%M:%S')
+             ,'python': platform.python_version()
+             ,'numpy': np.__version__
+             ,'platform': platform.platform()
+             ,'options': options
+             ,'benchmarks': {}}
+    try:
+        for name in names:
+            seconds = []
+            for natom in sizes[name]:
+                seconds.append(BENCHMARKS[name](natom, options, work_dir))
+                if verbose:
+                    print '%-20s %8d %12.6f s' % (name, natom, seconds[-1])
+            report['benchmarks'][name] = {'sizes': list(sizes[name]), 'seconds': seconds
+                                         ,'exponent': scaling_exponent(sizes[name], seconds)}
+    finally:
+        shutil.rmtree(work_dir)
+        if cache is not None:
+            result_cache.enable_cache(cache.get_cache_dir(), cache.get_max_bytes())
+    return report
+
+def save_report(report, json_file):
+    """
+    parameters:
+        report: dict | from run_suite
+        json_file: string | name for JSON file
+    """
+    with open(json_file, 'w') as outfile:
+        json.dump(report, outfile, indent=2, sort_keys=True)
+
+def load_report(json_file):
+    """
+    return: dict | report saved by save_report
+    parameters:
+        json_file: string | name of JSON file
+    """
+    with open(json_file, 'r') as infile:
+        return json.load(infile)
+
+def compare_reports(old, new, tolerance=1.2):
+    """
+    return: list[tuple(string, int, float, float)] | benchmark, size, old
+            and new seconds for each size that is slower than old by more
+            than the tolerance factor
+    parameters:
+        old: dict | baseline report
+        new: dict | report to check
+        tolerance: float | allowed ratio of new to old seconds
+    """
+    regressions = []
+    for name in sorted(new['benchmarks']):
+        if name not in old['benchmarks']:
+            continue
+        old_seconds = dict(zip(old['benchmarks'][name]['sizes'], old['benchmarks'][name]['seconds']))
+        for natom, seconds in zip(new['benchmarks'][name]['sizes'], new['benchmarks'][name]['seconds']):
+            if natom in old_seconds and seconds > tolerance * old_seconds[natom]:
+                regressions.append((name, natom, old_seconds[natom], seconds))
+    return regressions
+
+def report_str(report, baseline=None):
+    """
+    return: string | table of seconds per size and scaling exponents,
+                     with speedups over baseline if given
+    parameters:
+        report: dict | from run_suite
+        baseline: dict | earlier report to compare against
+    """
+    s = '%-20s %8s %12s %10s\n' % ('benchmark', 'natom', 'seconds', 'speedup')
+    for name in sorted(report['benchmarks']):
+        result = report['benchmarks'][name]
+        old = {}
+        if baseline and name in baseline['benchmarks']:
+            old = dict(zip(baseline['benchmarks'][name]['sizes']
+                          ,baseline['benchmarks'][name]['seconds']))
+        for natom, seconds in zip(result['sizes'], result['seconds']):
+            speedup = '%10.2f' % (old[natom] / seconds) if natom in old else '%10s' % '-'
+            s += '%-20s %8d %12.6f %s\n' % (name, natom, seconds, speedup)
+        if result['exponent'] is not None:
+            s += '%-20s %8s %12s   O(N^%.2f)\n' % ('', '', '', result['exponent'])
+    return s
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Time PyMoDA on synthetic trajectories')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, help='atoms, for every benchmark')
+    parser.add_argument('--nframes', type=int, default=3)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--kind', choices=KINDS, default='random')
+    parser.add_argument('--shape', choices=SHAPES, default='cubic')
+    parser.add_argument('--output', default='benchmarks.json', help='JSON report')
+    parser.add_argument('--compare', help='earlier JSON report')
+    parser.add_argument('--tolerance', type=float, default=1.2)
+    args = parser.parse_args()
+
+    sizes = dict((name, args.sizes) for name in BENCHMARKS) if args.sizes else None
+    report = run_suite(args.benchmarks, sizes, args.nframes, args.repeats, args.kind, args.shape)
+    save_report(report, args.output)
+
+    baseline = load_report(args.compare) if args.compare else None
+    print
+    print report_str(report, baseline)
+    if baseline:
+        for name, natom, old_seconds, seconds in compare_reports(baseline, report, args.tolerance):
+            print 'REGRESSION %s natom=%d: %.6f s -> %.6f s' % (name, natom, old_seconds, seconds)
+
+
+if __name__ == '__main__':
+    main()
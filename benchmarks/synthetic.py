@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+synthetic.py
+Author: Brian Boates
+
+Synthetic configurations and trj files of a given size and cell shape
+"""
+import sys
+sys.dont_write_bytecode = True
+import os
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import file_tools
+from lattice import Lattice
+from configuration import Configuration
+
+SHAPES = ('cubic', 'orthorhombic', 'monoclinic', 'triclinic')
+KINDS = ('random', 'lattice')
+
+def make_lattice(natom, shape='cubic', density=0.1):
+    """
+    return: Lattice | of volume natom / density
+    parameters:
+        natom: int | number of atoms
+        shape: string | one of SHAPES
+        density: float | atoms per cubic length unit
+    """
+    if shape == 'cubic':
+        matrix = np.eye(3)
+    elif shape == 'orthorhombic':
+        matrix = np.diag([1.0, 1.25, 1.5])
+    elif shape == 'monoclinic':
+        matrix = np.array([[1.0, 0.0, 0.0], [0.0, 1.2, 0.0], [0.3, 0.0, 1.1]])
+    elif shape == 'triclinic':
+        matrix = np.array([[1.0, 0.0, 0.0], [0.25, 1.1, 0.0], [0.2, 0.3, 1.2]])
+    else:
+        raise ValueError, 'shape must be one of %s' % ', '.join(SHAPES)
+    scale = (natom / density / abs(np.linalg.det(matrix)))**(1.0/3.0)
+    return Lattice(*(matrix * scale).ravel())
+
+def _species(natom, names):
+    """
+    return: list[int] | number of atoms of each type, as even as possible
+    """
+    counts = [natom // len(names)] * len(names)
+    for idx in xrange(natom - sum(counts)):
+        counts[idx] += 1
+    return counts
+
+def make_configuration(natom, kind='random', shape='cubic', density=0.1
+                      ,names=('H', 'O'), displacement=0.05, random_state=None):
+    """
+    return: Configuration
+    parameters:
+        natom: int | number of atoms
+        kind: string | 'random' positions, or 'lattice' sites (simple cubic
+                       grid in reduced coordinates) with random displacements
+        shape: string | one of SHAPES
+        density: float | atoms per cubic length unit
+        names: list[string] | atom types, split as evenly as possible
+        displacement: float | reduced displacement amplitude for 'lattice'
+        random_state: np.random.RandomState
+    """
+    random_state = random_state or np.random.RandomState(0)
+    if kind == 'random':
+        positions = random_state.rand(natom, 3)
+    elif kind == 'lattice':
+        nside = int(np.ceil(natom**(1.0/3.0) - 1e-9))
+        sites = np.indices((nside,)*3).reshape(3, -1).T[:natom] / float(nside)
+        positions = sites + displacement / nside * random_state.randn(natom, 3)
+        positions -= np.floor(positions)
+    else:
+        raise ValueError, 'kind must be one of %s' % ', '.join(KINDS)
+    configuration = Configuration(lattice=make_lattice(natom, shape, density))
+    configuration.set_atom_positions(names, _species(natom, names), positions)
+    return configuration
+
+def iter_configurations(natom, nframes, kind='random', shape='cubic', density=0.1
+                       ,names=('H', 'O'), seed=0):
+    """
+    Frames are generated one at a time, 'lattice' frames vibrate about
+    the same sites
+
+    return: iterator[Configuration]
+    parameters:
+        natom: int | number of atoms per frame
+        nframes: int | number of frames
+        kind: string | 'random' or 'lattice'
+        shape: string | one of SHAPES
+        density: float | atoms per cubic length unit
+        names: list[string] | atom types
+        seed: int | random seed
+    """
+    random_state = np.random.RandomState(seed)
+    for frame in xrange(nframes):
+        yield make_configuration(natom, kind, shape, density, names
+                                ,random_state=random_state)
+
+def write_synthetic_trj(trj_file, natom, nframes, kind='random', shape='cubic'
+                       ,density=0.1, names=('H', 'O'), seed=0, precision=10):
+    """
+    parameters:
+        trj_file: string | name for trj file
+        natom: int | number of atoms per frame
+        nframes: int | number of frames
+        kind: string | 'random' or 'lattice'
+        shape: string | one of SHAPES
+        density: float | atoms per cubic length unit
+        names: list[string] | atom types
+        seed: int | random seed
+        precision: int | number of decimals for reduced coordinates
+    """
+    file_tools.write_trj(iter_configurations(natom, nframes, kind, shape, density
+                                            ,names, seed)
+                        ,trj_file, precision)
@@ -15,19 +15,23 @@ from utils import pbc_displacement
 class Atom(object):
     """
     """
-    def __init__(self, name, position):
+    def __init__(self, name, position, owner=None):
         """
         parameters:
             name: string | atom type (i.e. H, He, Li, ...)
             position: np.array[float] | reduced coordinates
+            owner: Configuration | notified when the position changes
+
+        With an owner, a float np.array position is not copied, so an
+        Atom built from a row of the owner's position array is a view
+        into it. Otherwise the position is copied.
         """
         self._name = name
-        self._a = position[0]
-        self._b = position[1]
-        self._c = position[2]
-        self._x = None
-        self._y = None
-        self._z = None
+        if owner is None:
+            self._position = np.array(position, dtype=float)[:3]
+        else:
+            self._position = np.asarray(position, dtype=float)[:3]
+        self._owner = owner
         self._velocity = None
 
     def __str__(self):
@@ -44,6 +48,14 @@ class Atom(object):
         """
         return self.__str__()
 
+    def __getstate__(self):
+        """
+        return: dict | state for pickling, without the owner
+        """
+        state = self.__dict__.copy()
+        state['_owner'] = None
+        return state
+
     def __eq__(self, atom):
         """
         return: bool
@@ -70,23 +82,30 @@ class Atom(object):
     def set_name(self, name):
         self._name = name
 
+    def _position_changed(self):
+        self._velocity = None
+        if self._owner is not None:
+            self._owner.touch()
+
     def set_a(self, a):
-        self._a = a
+        self._position[0] = a
+        self._position_changed()
 
     def set_b(self, b):
-        self._b = b
+        self._position[1] = b
+        self._position_changed()
 
     def set_c(self, c):
-        self._c = c
+        self._position[2] = c
+        self._position_changed()
 
     def set_position(self, position):
         """
         parameters:
             position: np.array[float] | length 3
         """
-        self.set_a(position[0])
-        self.set_b(position[1])
-        self.set_c(position[2])
+        self._position[:] = position[:3]
+        self._position_changed()
 
     def get_name(self):
         """
@@ -104,19 +123,19 @@ class Atom(object):
         """
         return: float | reduced a coordinate
         """
-        return self._a
+        return self._position[0]
 
     def get_b(self):
         """
         return: float | reduced b coordinate
         """
-        return self._b
+        return self._position[1]
 
     def get_c(self):
         """
         return: float | reduced c coordinate
         """
-        return self._c
+        return self._position[2]
 
     def _compute_x(self, lattice):
         """
@@ -124,10 +143,7 @@ class Atom(object):
         parameters:
             lattice: Lattice
         """
-        x  = self.get_a() * lattice.get_ax()
-        x += self.get_b() * lattice.get_bx()
-        x += self.get_c() * lattice.get_cx()
-        return x
+        return np.dot(self._position, lattice.get_matrix()[:,0])
 
     def _compute_y(self, lattice):
         """
@@ -135,10 +151,7 @@ class Atom(object):
         parameters:
             lattice: Lattice
         """
-        y  = self.get_a() * lattice.get_ay()
-        y += self.get_b() * lattice.get_by()
-        y += self.get_c() * lattice.get_cy()
-        return y
+        return np.dot(self._position, lattice.get_matrix()[:,1])
 
     def _compute_z(self, lattice):
         """
@@ -146,10 +159,7 @@ class Atom(object):
         parameters:
             lattice: Lattice
         """
-        z  = self.get_a() * lattice.get_az()
-        z += self.get_b() * lattice.get_bz()
-        z += self.get_c() * lattice.get_cz()
-        return z
+        return np.dot(self._position, lattice.get_matrix()[:,2])
 
     def get_x(self, lattice):
         """
@@ -157,9 +167,7 @@ class Atom(object):
         parameters:
             lattice: Lattice
         """
-        if not self._x:
-            self._x = self._compute_x(lattice)
-        return self._x
+        return self._compute_x(lattice)
 
     def get_y(self, lattice):
         """
@@ -167,9 +175,7 @@ class Atom(object):
         parameters:
             lattice: Lattice
         """
-        if not self._y:
-            self._y = self._compute_y(lattice)
-        return self._y
+        return self._compute_y(lattice)
 
     def get_z(self, lattice):
         """
@@ -177,9 +183,7 @@ class Atom(object):
         parameters:
             lattice: Lattice
         """
-        if not self._z:
-            self._z = self._compute_z(lattice)
-        return self._z
+        return self._compute_z(lattice)
 
     def get_position(self, unit='reduced', lattice=None):
         """
@@ -189,11 +193,11 @@ class Atom(object):
             lattice: Lattice
         """
         if unit == 'reduced':
-            return np.array([self.get_a(), self.get_b(), self.get_c()])
+            return self._position.copy()
         elif unit == 'cartesian':
             if not lattice:
                 raise ValueError, 'lattice required for cartesian position'
-            return np.array([self.get_x(lattice), self.get_y(lattice), self.get_z(lattice)])
+            return lattice.to_cartesian(self._position)
         else:
             raise ValueError, 'unit must be reduced or cartesian'
 
@@ -201,10 +205,7 @@ class Atom(object):
         """
         return: np.array[float] | length 3
         """
-        wrapped_a = self.get_a() - np.floor(self.get_a())
-        wrapped_b = self.get_b() - np.floor(self.get_b())
-        wrapped_c = self.get_c() - np.floor(self.get_c())
-        return np.array([wrapped_a, wrapped_b, wrapped_c])
+        return self._position - np.floor(self._position)
 
     def wrap_position(self):
         """
@@ -228,9 +229,9 @@ class Atom(object):
         if not prev_lattice:
             prev_lattice = lattice
 
-        dx = self.get_x(cur_lattice) - prev_atom.get_x(prev_lattice)
-        dy = self.get_y(cur_lattice) - prev_atom.get_y(prev_lattice)
-        dz = self.get_z(cur_lattice) - prev_atom.get_z(prev_lattice)
+        dx = self.get_x(lattice) - prev_atom.get_x(prev_lattice)
+        dy = self.get_y(lattice) - prev_atom.get_y(prev_lattice)
+        dz = self.get_z(lattice) - prev_atom.get_z(prev_lattice)
         vx = dx / dt if dt != 0 else np.inf
         vy = dy / dt if dt != 0 else np.inf
         vz = dz / dt if dt != 0 else np.inf
@@ -248,8 +249,8 @@ class Atom(object):
             lattice: Lattice | lattice for atom at current position
             prev_lattice: Lattice | lattice for atom at previous position
         """
-        if not self._velocity:
-            self._velocity = self._compute_velocity(prev_atom, df, lattice, prev_lattice)
+        if self._velocity is None:
+            self._velocity = self._compute_velocity(prev_atom, dt, lattice, prev_lattice)
         return self._velocity
 
     def to_pkl(self, file_name='atom.pkl'):
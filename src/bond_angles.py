@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+bond_angles.py
+Author: Brian Boates
+
+Bond angle distributions accumulated over configurations
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+from utils import map_frames
+from utils import supercell_size
+from bond_graph import cutoff_matrix
+
+def bond_angles(configuration, cutoffs):
+    """
+    Every neighbor-center-neighbor angle, from the minimum image bond
+    vectors of each atom's bonds
+
+    return: tuple(np.array[float], np.array[int], np.array[int], np.array[int])
+            | angles in degrees and the atom type index of the first
+              neighbor, center and second neighbor of each angle
+    parameters:
+        configuration: Configuration
+        cutoffs: float or dict[string:float] | one cutoff for all pairs,
+                                               or one per pair (e.g. 'C-O')
+    """
+    # bond vectors are minimum images, so small cells are replicated
+    # (each angle then appears A * B * C times)
+    cutoff = np.max(cutoff_matrix(configuration.get_atom_types(), cutoffs))
+    size = supercell_size(configuration.get_lattice(), cutoff)
+    if np.any(size > 1):
+        configuration = configuration.get_supercell(*size)
+
+    indptr, indices, distances = configuration.get_bond_graph(cutoffs).get_adjacency()
+    nbonds = np.diff(indptr)
+    centers = np.repeat(np.arange(len(nbonds)), nbonds)
+
+    positions = configuration.get_positions()
+    diff = positions[indices] - positions[centers]
+    diff -= np.round(diff)
+    vectors = configuration.get_lattice().to_cartesian(diff)
+
+    # pair each bond with the later bonds of the same center
+    rank = np.arange(len(indices)) - np.repeat(indptr[:-1], nbonds)
+    nlater = nbonds[centers] - 1 - rank
+    first = np.repeat(np.arange(len(indices)), nlater)
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(nlater) - nlater, nlater)
+
+    cosines = np.einsum('ij,ij->i', vectors[first], vectors[second])
+    cosines /= distances[first] * distances[second]
+    angles = np.degrees(np.arccos(np.clip(cosines, -1.0, 1.0)))
+    species = configuration.get_species()
+    return angles, species[indices[first]], species[centers[first]], species[indices[second]]
+
+def bond_angle_frames(configurations, cutoffs, nbins):
+    """
+    return: dict[string:np.array[int]] | histogram of angles over [0, 180]
+                                         for each triplet (e.g. 'H-O-H')
+    parameters:
+        configurations: iterable[Configuration]
+        cutoffs: float or dict[string:float] | bond cutoffs
+        nbins: int | number of histogram bins
+    """
+    histograms = {}
+    for configuration in configurations:
+
+        names = configuration.get_atom_types()
+        ntypes = len(names)
+        angles, neighbor1, center, neighbor2 = bond_angles(configuration, cutoffs)
+        low, high = np.minimum(neighbor1, neighbor2), np.maximum(neighbor1, neighbor2)
+        triplet = (low * ntypes + center) * ntypes + high
+        bins = np.minimum((angles * nbins / 180.0).astype(int), nbins - 1)
+        counts = np.bincount(triplet * nbins + bins, minlength=ntypes**3 * nbins)
+        counts = counts.reshape(ntypes, ntypes, ntypes, nbins)
+
+        for a, b, c in zip(*np.nonzero(np.sum(counts, axis=3))):
+            first, last = sorted([names[a], names[c]])
+            key = '%s-%s-%s' % (first, names[b], last)
+            histograms[key] = histograms.get(key, 0) + counts[a,b,c]
+
+    return histograms
+
+def compute_bond_angles(configurations, cutoffs, nbins=180, nprocs=1):
+    """
+    Memory is bounded by the number of bins, angles are only held for
+    one configuration at a time
+
+    return: tuple(np.array[float], dict[string:np.array[float]])
+            | bin centers in degrees and the normalized angle distribution
+              of each triplet (e.g. 'H-O-H', center in the middle)
+    parameters:
+        configurations: iterable[Configuration]
+        cutoffs: float or dict[string:float] | one cutoff for all pairs,
+                                               or one per pair (e.g. 'C-O')
+        nbins: int | number of histogram bins
+        nprocs: int | number of worker processes
+    """
+    histograms = {}
+    for partial in map_frames(bond_angle_frames, configurations, (cutoffs, nbins), nprocs):
+        for key in partial:
+            histograms[key] = histograms.get(key, 0) + partial[key]
+
+    width = 180.0 / nbins
+    angles = (np.arange(nbins) + 0.5) * width
+    return angles, dict((key, histograms[key] / (np.sum(histograms[key]) * width))
+                        for key in histograms)
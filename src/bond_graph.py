@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+bond_graph.py
+Author: Brian Boates
+
+Implements BondGraph()
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+
+def cutoff_matrix(names, cutoffs):
+    """
+    return: np.array[float] | (ntypes, ntypes) bond cutoff of each atom
+                              type pair, 0 for pairs that never bond
+    parameters:
+        names: list[string] | atom types
+        cutoffs: float or dict[string:float] | one cutoff for all pairs,
+                                               or one per pair in either
+                                               order (e.g. 'C-O' or 'O-C')
+    """
+    if not isinstance(cutoffs, dict):
+        return np.full((len(names), len(names)), float(cutoffs))
+    matrix = np.zeros((len(names), len(names)))
+    pairs = {}
+    for key, cutoff in cutoffs.items():
+        pair = key.split('-')
+        if len(pair) != 2:
+            raise ValueError, 'cutoff key %s is not an atom type pair (e.g. C-O)' % key
+        for name in pair:
+            if name not in names:
+                raise ValueError, 'cutoff key %s names atom type %s, not one of %s' % (key, name
+                                                                                      ,', '.join(names))
+        pair = tuple(sorted(pair))
+        if pairs.setdefault(pair, float(cutoff)) != float(cutoff):
+            raise ValueError, 'different cutoffs for atom type pair %s' % key
+        a, b = names.index(pair[0]), names.index(pair[1])
+        matrix[a,b] = matrix[b,a] = float(cutoff)
+    return matrix
+
+class BondGraph(object):
+    """
+    Symmetric sparse adjacency (CSR) of the bonds of one configuration
+    """
+    def __init__(self, natom, idx1, idx2, distances):
+        """
+        parameters:
+            natom: int | number of atoms
+            idx1: np.array[int] | first atom of each bond
+            idx2: np.array[int] | second atom of each bond
+            distances: np.array[float] | length of each bond
+        """
+        rows = np.concatenate((idx1, idx2))
+        order = np.argsort(rows, kind='mergesort')
+        self._natom = natom
+        self._bonds = (np.asarray(idx1), np.asarray(idx2))
+        self._indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=natom))))
+        self._indices = np.concatenate((idx2, idx1))[order]
+        self._distances = np.concatenate((distances, distances))[order]
+        self._labels = None
+
+    def __str__(self):
+        """
+        return: string
+        """
+        s = '<BondGraph: natom=%s, nbonds=%s>' % (self.get_natom(), self.get_nbonds())
+        return s
+
+    def __repr__(self):
+        """
+        return: string
+        """
+        return self.__str__()
+
+    def get_natom(self):
+        """
+        return: int
+        """
+        return self._natom
+
+    def get_nbonds(self):
+        """
+        return: int
+        """
+        return len(self._bonds[0])
+
+    def get_bonds(self):
+        """
+        return: tuple(np.array[int], np.array[int]) | atoms of each bond
+        """
+        return self._bonds
+
+    def get_adjacency(self):
+        """
+        return: tuple(np.array[int], np.array[int], np.array[float])
+                | CSR indptr, bonded atom indices and bond lengths; the
+                  bonds of atom i are indptr[i]:indptr[i+1]
+        """
+        return self._indptr, self._indices, self._distances
+
+    def get_neighbors(self, idx):
+        """
+        return: tuple(np.array[int], np.array[float]) | atoms bonded to
+                                                        atom idx and bond lengths
+        parameters:
+            idx: int | atom index
+        """
+        start, stop = self._indptr[idx], self._indptr[idx+1]
+        return self._indices[start:stop], self._distances[start:stop]
+
+    def get_coordination(self, species=None, neighbor_species=None):
+        """
+        return: np.array[int] | (natom,) number of bonds of each atom
+        parameters:
+            species: np.array[int] | (natom,) atom type index of each atom
+            neighbor_species: int | only count bonds to atoms of this type index
+        """
+        if neighbor_species is None:
+            return np.diff(self._indptr)
+        rows = np.repeat(np.arange(self.get_natom()), np.diff(self._indptr))
+        bonded = species[self._indices] == neighbor_species
+        return np.bincount(rows[bonded], minlength=self.get_natom())
+
+    def get_cluster_labels(self):
+        """
+        Connected components by vectorized union-find: each bond hooks the
+        larger of its two roots onto the smaller, then paths are
+        compressed, until every bond joins atoms with the same root
+
+        return: np.array[int] | (natom,) cluster index of each atom,
+                                numbered 0, 1, ... by lowest atom index
+        """
+        if self._labels is not None:
+            return self._labels
+        idx1, idx2 = self._bonds
+        parent = np.arange(self.get_natom())
+        while True:
+            root1, root2 = parent[idx1], parent[idx2]
+            unjoined = root1 != root2
+            if not np.any(unjoined):
+                break
+            low = np.minimum(root1[unjoined], root2[unjoined])
+            high = np.maximum(root1[unjoined], root2[unjoined])
+            np.minimum.at(parent, high, low)
+            while True:
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+        self._labels = np.unique(parent, return_inverse=True)[1]
+        return self._labels
+
+    def get_cluster_sizes(self):
+        """
+        return: np.array[int] | number of atoms in each cluster
+        """
+        return np.bincount(self.get_cluster_labels())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+clusters.py
+Author: Brian Boates
+
+Cluster size distributions from bond graphs, over configurations
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+from utils import map_frames
+
+def cluster_size_frames(configurations, cutoffs):
+    """
+    return: np.array[int] | number of clusters of each size (by index)
+                            summed over the configurations
+    parameters:
+        configurations: iterable[Configuration]
+        cutoffs: float or dict[string:float] | bond cutoffs
+    """
+    counts = np.zeros(1, dtype=int)
+    for configuration in configurations:
+        sizes = np.bincount(configuration.get_bond_graph(cutoffs).get_cluster_sizes())
+        counts = _add_counts(counts, sizes)
+    return counts
+
+def _add_counts(counts1, counts2):
+    """
+    return: np.array[int] | sum of two count arrays of different lengths
+    """
+    if len(counts1) < len(counts2):
+        counts1, counts2 = counts2, counts1
+    total = counts1.copy()
+    total[:len(counts2)] += counts2
+    return total
+
+def compute_cluster_sizes(configurations, cutoffs, nprocs=1):
+    """
+    return: tuple(np.array[int], np.array[int]) | cluster sizes and how
+                                                  many clusters of each
+                                                  size were found in total
+    parameters:
+        configurations: iterable[Configuration]
+        cutoffs: float or dict[string:float] | bond cutoffs
+        nprocs: int | number of worker processes
+    """
+    counts = np.zeros(1, dtype=int)
+    for partial_counts in map_frames(cluster_size_frames, configurations, (cutoffs,), nprocs):
+        counts = _add_counts(counts, partial_counts)
+    sizes = np.flatnonzero(counts)
+    return sizes, counts[sizes]
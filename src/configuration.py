@@ -10,9 +10,18 @@ sys.dont_write_bytecode = True
 import numpy as np
 from collections import defaultdict
 import file_tools
-from utils import pbc_distance
+import instrument
+from utils import pbc_distances
+from utils import cell_list_pairs
+from utils import atomic_masses
+from utils import AMU_PER_A3_TO_G_PER_CM3
 from atom import Atom
 from lattice import Lattice
+from structure_factor import compute_structure_factor
+from bond_graph import BondGraph
+from bond_graph import cutoff_matrix
+from result_cache import cached
+from result_cache import fingerprint_arrays
 
 class Configuration(object):
     """
@@ -22,9 +31,26 @@ class Configuration(object):
         parameters:
             atom: list[Atom]
             lattice: Lattice
-        """
-        self._atoms = defaultdict(list)
+
+        Atoms are stored as one (N, 3) array of reduced positions, kept
+        grouped by atom type in order of first insertion, along with an
+        (N,) array of atom type indices into get_atom_types(). Every
+        change to the positions or lattice bumps get_version(). Inserts
+        are staged and merged into the arrays on the next read, so
+        building a configuration one atom at a time stays O(N).
+        """
+        self._positions = np.zeros((0, 3))
+        self._species = np.zeros(0, dtype=int)
+        self._names = []
+        self._pending = []
+        self._ranges = {}
+        self._atoms = None
+        self._masses = None
         self._lattice = lattice
+        self._version = 0
+        self._cartesian = None
+        self._cartesian_key = None
+        self._fingerprint = None
         self.insert_atoms(atoms)
 
     def __str__(self):
@@ -46,20 +72,38 @@ class Configuration(object):
         """
         return iter(self.get_atoms())
 
-    def trj_str(self):
+    def __getstate__(self):
+        """
+        return: dict | state for pickling, without the Atom views
+                       or cartesian positions
+        """
+        self._merge_pending()
+        state = self.__dict__.copy()
+        state['_atoms'] = None
+        state['_cartesian'] = None
+        state['_cartesian_key'] = None
+        state['_fingerprint'] = None
+        return state
+
+    @instrument.timed('configuration.trj_str')
+    def trj_str(self, precision=10):
         """
         return: string | for trj file
+        parameters:
+            precision: int | number of decimals for reduced coordinates
         """
+        names = self.get_atom_types()
         s = self.get_lattice().trj_str()
+        s += ' '.join(names) + '\n'
+        s += ' '.join(str(self.get_natom(name)) for name in names) + '\n'
 
-        name_str, count_str = '', ''
-        for name, atoms in self._atoms.iteritems():
-            name_str += '%s ' % name
-            count_str += '%s ' % len(atoms)
-        s += name_str.strip() + '\n' + count_str.strip() + '\n'
-
-        for atom in self:
-            s += atom.trj_str()
+        # each type's coordinate block is formatted in one call
+        blocks = []
+        for name in names:
+            row = '%s %%.%df %%.%df %%.%df\n' % ((name.replace('%', '%%'),) + (precision,)*3)
+            positions = self.get_positions(name)
+            blocks.append((row * len(positions)) % tuple(positions.ravel()))
+        s += ''.join(blocks)
 
         return s
 
@@ -71,62 +115,272 @@ class Configuration(object):
 
     def set_lattice(self, lattice):
         self._lattice = lattice
+        self.touch()
+
+    def get_version(self):
+        """
+        return: int | stamp bumped by every position or lattice change
+        """
+        return self._version
+
+    def touch(self):
+        """
+        Marks the positions as changed, invalidating cached values
+        """
+        self._version += 1
+
+    def get_fingerprint(self):
+        """
+        Recomputed only when the positions or lattice change
+
+        return: string | digest of the atom types, positions and lattice,
+                         the input key for cached analyses
+        """
+        self._merge_pending()
+        matrix = self.get_lattice().get_matrix()
+        key = self._fingerprint
+        if key is None or key[0] != self._version or key[1] is not matrix:
+            names = self.get_atom_types()
+            counts = [self.get_natom(name) for name in names]
+            digest = fingerprint_arrays([np.array(names, dtype='S'), np.array(counts)
+                                        ,self._positions, matrix])
+            self._fingerprint = (self._version, matrix, digest)
+        return self._fingerprint[2]
+
+    def get_positions(self, name=None):
+        """
+        return: np.array[float] | (natom, 3) reduced coordinates, a
+                                  read-only view into the configuration's
+                                  storage (write with set_positions)
+        parameters:
+            name: string | type of atoms to get
+        """
+        self._merge_pending()
+        start, stop = self.get_species_range(name) if name else (0, len(self._positions))
+        positions = self._positions[start:stop]
+        positions.flags.writeable = False
+        return positions
+
+    def set_positions(self, positions, name=None):
+        """
+        parameters:
+            positions: np.array[float] | (natom, 3) reduced coordinates
+            name: string | type of atoms to set
+        """
+        self._merge_pending()
+        start, stop = self.get_species_range(name) if name else (0, len(self._positions))
+        self._positions[start:stop] = positions
+        self.touch()
+
+    def get_cartesian_positions(self, name=None):
+        """
+        Computed in one matrix product and reused until the positions or
+        lattice change (the lattice matrix is replaced by any Lattice
+        setter, so editing the lattice in place is also caught).
+
+        return: np.array[float] | (natom, 3) read-only cartesian coordinates
+        parameters:
+            name: string | type of atoms to get
+        """
+        self._merge_pending()
+        matrix = self.get_lattice().get_matrix()
+        key = self._cartesian_key
+        if key is None or key[0] != self._version or key[1] is not matrix:
+            instrument.count('configuration.cartesian_conversions')
+            self._cartesian = self.get_lattice().to_cartesian(self._positions)
+            self._cartesian.flags.writeable = False
+            self._cartesian_key = (self._version, matrix)
+        if not name:
+            return self._cartesian
+        start, stop = self.get_species_range(name)
+        return self._cartesian[start:stop]
+
+    def get_species(self):
+        """
+        return: np.array[int] | (natom,) index into get_atom_types() per atom
+        """
+        self._merge_pending()
+        return self._species
+
+    def get_species_range(self, name):
+        """
+        return: tuple(int, int) | start and stop index of atom type name
+        parameters:
+            name: string | atom type
+        """
+        self._merge_pending()
+        return self._ranges.get(name, (0, 0))
+
+    def _merge_pending(self):
+        """
+        Merges the positions staged by insert_positions into the arrays,
+        keeping atoms grouped by type in insertion order
+        """
+        if not self._pending:
+            return
+        indices, positions = zip(*self._pending)
+        self._pending = []
+        species = np.concatenate((self._species
+                                 ,np.repeat(indices, [len(p) for p in positions])))
+        order = np.argsort(species, kind='mergesort')
+        self._species = species[order]
+        self._positions = np.concatenate((self._positions,) + positions)[order]
+        self._update_ranges()
+
+    def _update_ranges(self):
+        counts = np.bincount(self._species, minlength=len(self._names))
+        stops = np.cumsum(counts)
+        self._ranges = {}
+        for name, count, stop in zip(self._names, counts, stops):
+            self._ranges[name] = (int(stop - count), int(stop))
+        # any Atom views refer to the storage before the update
+        self._atoms = None
+        self._masses = None
+        self.touch()
 
     def get_atoms_dict(self):
         """
-        return: dict[]
+        return: dict[string:list[Atom]]
         """
-        return self._atoms
+        return dict((name, self.get_atoms(name)) for name in self.get_atom_types())
 
     def get_atoms(self, name=None):
         """
+        Atoms are views into the configuration's storage and are only
+        valid until the next insert into the configuration.
+
         return: list[Atom]
         parameters:
             name: string | type of atoms to get
         """
+        self._merge_pending()
+        if self._atoms is None:
+            self._atoms = [Atom(self._names[s], self._positions[i], self)
+                           for i, s in enumerate(self._species)]
         if not name:
-            return list(np.concatenate(self.get_atoms_dict().values()))
+            return self._atoms
         else:
-            return self.get_atoms_dict()[name]
+            start, stop = self.get_species_range(name)
+            return self._atoms[start:stop]
 
     def get_natom(self, name=None):
         """
         return: int | number of atoms currently in configuration
         """
-        return len(self.get_atoms(name))
+        self._merge_pending()
+        if not name:
+            return len(self._positions)
+        start, stop = self.get_species_range(name)
+        return stop - start
 
     def get_atom_types(self):
         """
         return: list[string]
         """
-        return self._atoms.keys()
+        return list(self._names)
 
     def get_ntypes(self):
         """
         return: int | number of different atom types
         """
-        return len(self.get_atom_types())
+        return len(self._names)
+
+    def get_masses(self, name=None):
+        """
+        return: np.array[float] | (natom,) atomic mass in amu of each atom
+        parameters:
+            name: string | type of atoms to get
+        """
+        self._merge_pending()
+        if self._masses is None:
+            self._masses = atomic_masses(self._names)[self._species]
+            self._masses.flags.writeable = False
+        if not name:
+            return self._masses
+        start, stop = self.get_species_range(name)
+        return self._masses[start:stop]
+
+    def get_total_mass(self):
+        """
+        return: float | total mass in amu
+        """
+        return float(np.sum(self.get_masses()))
+
+    def get_center_of_mass(self):
+        """
+        Mass weighted mean of the cartesian positions as stored, so
+        molecules split across the cell should be unwrapped first
+
+        return: np.array[float] | length 3 cartesian center of mass
+        """
+        return np.dot(self.get_masses(), self.get_cartesian_positions()) / self.get_total_mass()
+
+    def get_density(self):
+        """
+        return: float | mass density in g/cm^3 (for lattice vectors in Angstrom)
+        """
+        return self.get_total_mass() / self.get_lattice().volume() * AMU_PER_A3_TO_G_PER_CM3
+
+    def insert_positions(self, name, positions):
+        """
+        parameters:
+            name: string | atom type
+            positions: np.array[float] | (n, 3) reduced coordinates
+        """
+        positions = np.array(positions, dtype=float).reshape(-1, 3)
+        if name not in self._names:
+            self._names.append(name)
+        self._pending.append((self._names.index(name), positions))
+        self.touch()
+
+    def set_atom_positions(self, names, counts, positions):
+        """
+        Replaces all atoms in the configuration in one step
+
+        parameters:
+            names: list[string] | distinct atom types
+            counts: list[int] | number of atoms of each type
+            positions: np.array[float] | (natom, 3) reduced coordinates,
+                                         grouped by type in order of names
+        """
+        self._names = list(names)
+        self._pending = []
+        self._positions = np.array(positions, dtype=float).reshape(-1, 3)
+        self._species = np.repeat(np.arange(len(self._names)), counts)
+        self._update_ranges()
 
     def insert_atom(self, atom):
-        self._atoms[atom.get_name()].append(atom)
+        self.insert_positions(atom.get_name(), atom.get_position())
 
     def insert_atoms(self, atoms):
         """
         parameters:
             atoms: list[Atom]
         """
+        names = []
+        positions = defaultdict(list)
         for atom in atoms:
-            self.insert_atom(atom)
+            if atom.get_name() not in positions:
+                names.append(atom.get_name())
+            positions[atom.get_name()].append(atom.get_position())
+        for name in names:
+            self.insert_positions(name, positions[name])
 
+    @instrument.timed('configuration.wrap_coordinates')
     def wrap_coordinates(self):
         """
         Destructive: atom positions will be changed
         """
-        # using any() is faster than looping
-        any(atom.wrap_position() for atom in self.get_atoms())
+        self._merge_pending()
+        self._positions -= np.floor(self._positions)
+        self.touch()
 
     def get_supercell(self, A, B, C):
         """
+        Replicates the configuration A x B x C times. Atoms stay grouped
+        by type, and the first get_natom(name) atoms of each type are the
+        original cell.
+
         return: Configuration
         parameters:
             A: int | number of replications along a vector
@@ -134,79 +388,67 @@ class Configuration(object):
             C: int | number of replications along c vector
         """
         super_idx = np.array([A, B, C])
-        super_ax = self.get_lattice().get_ax() * A
-        super_ay = self.get_lattice().get_ay() * B
-        super_az = self.get_lattice().get_az() * C
-        super_bx = self.get_lattice().get_bx() * A
-        super_by = self.get_lattice().get_by() * B
-        super_bz = self.get_lattice().get_bz() * C
-        super_cx = self.get_lattice().get_cx() * A
-        super_cy = self.get_lattice().get_cy() * B
-        super_cz = self.get_lattice().get_cz() * C
-        super_lattice = Lattice(super_ax, super_ay, super_ax
-                               ,super_bx, super_by, super_bz
-                               ,super_cx, super_cy, super_cz)
-        supercell = Configuration(latttice=Lattice)
-
-        for atom in self.get_atoms():
-
-            new_atom = Atom(atom.name, atom.get_position()/super_idx)
-            supercell.insert_atom(new_atom)
-
-            for a in range(1, A):
-                position = [atom.get_a()+a, atom.get_b(), atom.get_c()]
-                supercell.insert_atom(atom.name, np.array(position)/super_idx)
-            for b in range(1, B):
-                position = [atom.get_a(), atom.get_b()+b, atom.get_c()]
-                supercell.insert_atom(atom.name, np.array(position)/super_idx)
-            for c in range(1, C):
-                position = [atom.get_a(), atom.get_b(), atom.get_c()+c]
-                supercell.insert_atom(atom.name, np.array(position)/super_idx)
-
-            for a in range(1, A):
-                for b in range(1, B):
-                    position = [atom.get_a()+a, atom.get_b()+b, atom.get_c()]
-                    supercell.insert_atom(atom.name, np.array(position)/super_idx)
-            for a in range(1, A):
-                for c in range(1, C):
-                    position = [atom.get_a()+a, atom.get_b(), atom.get_c()+c]
-                    supercell.insert_atom(atom.name, np.array(position)/super_idx)
-            for b in range(1, B):
-                for c in range(1, C):
-                    position = [atom.get_a(), atom.get_b()+b, atom.get_c()+c]
-                    supercell.insert_atom(atom.name, np.array(position)/super_idx)
-
-            for a in range(1, A):
-                for b in range(1, B):
-                    for c in range(1, C):
-                        position = [atom.get_a()+a, atom.get_b()+b, atom.get_c()+c]
-                        supercell.insert_atom(atom.name, np.array(position)/super_idx)
-
-            return supercell
+        lattice = self.get_lattice()
+        super_lattice = Lattice(*np.concatenate([lattice.get_a() * A
+                                                ,lattice.get_b() * B
+                                                ,lattice.get_c() * C]))
+        supercell = Configuration(lattice=super_lattice)
+
+        # (nimages, 1, 3) + (1, n, 3) image offsets broadcast over each type
+        images = np.indices(super_idx).reshape(3, -1).T[:,np.newaxis,:]
+        names = self.get_atom_types()
+        positions = [((images + self.get_positions(name)) / super_idx).reshape(-1, 3)
+                     for name in names]
+        counts = [len(p) for p in positions]
+        supercell.set_atom_positions(names, counts
+                                    ,np.concatenate(positions) if positions else np.zeros((0, 3)))
+        return supercell
+
+    def _pair_distances(self, name1, name2, unit):
+        """
+        return: np.array[float] | distances between name1 and name2 atoms,
+                                  each pair counted once if name1 == name2
+        parameters:
+            name1: string | atom type (None for all atoms)
+            name2: string | atom type (None for all atoms)
+            unit: string | either 'reduced' or 'cartesian'
+        """
+        positions1 = self.get_positions(name1)
+        positions2 = self.get_positions(name2)
+        instrument.count('configuration.pairs_evaluated', len(positions1) * len(positions2))
+        with instrument.timer('configuration.pair_distances'):
+            distances = pbc_distances(positions1, positions2, unit=unit
+                                     ,lattice=self.get_lattice())
+        if name1 == name2:
+            return distances[np.triu_indices(len(positions1), 1)]
+        return distances.ravel()
 
+    @instrument.timed('configuration.get_distances_dict')
     def get_distances_dict(self, unit='cartesian'):
         """
         Computes distances between all atoms and stores them
         in a dictionary where the key is a string representing
-        the atom pair type (e.g. 'C-O'), and the value is a
-        list of distances for that atom pair type.
+        the atom pair type (e.g. 'C-O'), and the value is an
+        array of distances for that atom pair type.
 
-        return: dict[string:list[float]]
+        return: dict[string:np.array[float]]
         parameters:
             unit: string | 'reduced' or 'cartesian' (default)
         """
-        distances = defaultdict(list)
-        atoms = self.get_atoms()
-        for i in xrange(len(atoms)):
-            name_i = atoms[i].get_name()
-            for j in xrange(i+1, len(atoms)):
-                name_j = atoms[j].get_name()
-                key = min(name_i, name_j) + '-' + max(name_i, name_j)
-                distances[key].append(pbc_distance(atoms[i], atoms[j], unit=unit
-                                                  ,lattice=self.get_lattice()))
+        def compute():
+            distances = {}
+            names = self.get_atom_types()
+            for i, name_i in enumerate(names):
+                for name_j in names[i:]:
+                    key = min(name_i, name_j) + '-' + max(name_i, name_j)
+                    pair_distances = self._pair_distances(name_i, name_j, unit)
+                    if len(pair_distances):
+                        distances[key] = pair_distances
+            return distances
 
-        return dict(distances)
+        return cached('distances_dict', self, {'unit': unit}, compute)
 
+    @instrument.timed('configuration.get_distances_list')
     def get_distances_list(self, name1=None, name2=None, unit='cartesian'):
         """
         There are a few cases depending on name1 and name2:
@@ -218,54 +460,118 @@ class Configuration(object):
         (3) name1 != None and name2 != None
             - All name1-name2 atom distances are returned
 
-        return: list[float] | distances between atoms
+        return: np.array[float] | distances between atoms
         parameters:
             name1: string | atom type
             name2: string | atom type
             unit: string | either 'reduced' or 'cartesian' (default)
         """
-        distances = []
         if name1 == name2:
-            atoms = self.get_atoms(name=name1)
-            for i in xrange(len(atoms)):
-                for j in xrange(i+1, len(atoms)):
-                    distances.append(pbc_distance(atoms[i], atoms[j], unit=unit
-                                                 ,lattice=self.get_lattice()))
+            return self._pair_distances(name1, name2, unit)
+
+        elif not name1 or not name2:
+            name = name1 if name1 else name2
+            distances = [self._pair_distances(name, atom_name, unit)
+                         for atom_name in self.get_atom_types()]
+            return np.concatenate(distances) if distances else np.zeros(0)
+
+        else:
+            return self._pair_distances(name1, name2, unit)
+
+    @instrument.timed('configuration.get_neighbors')
+    def get_neighbors(self, cutoff, name1=None, name2=None):
+        """
+        Finds atom pairs within cutoff using a periodic cell list. The
+        atom types select pairs as in get_distances_list. A cutoff over
+        half the shortest perpendicular cell width is handled as a
+        virtual supercell: each periodic image within cutoff is its own
+        pair, so the same atoms (or an atom and itself) can repeat.
+
+        return: tuple(np.array[int], np.array[int], np.array[float])
+                | atom indices (into get_atoms()) of each pair and
+                  their cartesian distance
+        parameters:
+            cutoff: float | cartesian cutoff radius
+            name1: string | atom type
+            name2: string | atom type
+        """
+        lattice = self.get_lattice()
+        if name1 == name2:
+            start = self.get_species_range(name1)[0] if name1 else 0
+            positions = self.get_positions(name1)
+            idx1, idx2, distances = cell_list_pairs(positions, positions, cutoff
+                                                   ,lattice, half=True)
+            return idx1 + start, idx2 + start, distances
 
         elif not name1 or not name2:
             name = name1 if name1 else name2
-            atoms = self.get_atoms(name=name)
-            atoms_dict = self.get_atoms_dict()
-            for atom_name in atoms_dict.keys():
-                if atom_name == name:
-                    for i in xrange(len(atoms)):
-                        for j in xrange(i+1, len(atoms)):
-                            distances.append(pbc_distance(atoms[i], atoms[j], unit=unit
-                                                         ,lattice=self.get_lattice()))
-                else:
-                    for atom1 in atoms:
-                        for atom2 in atoms_dict[atom_name]:
-                            distances.append(pbc_distance(atom1, atom2, unit=unit
-                                                         ,lattice=self.get_lattice()))
+            start, stop = self.get_species_range(name)
+            positions = self.get_positions(name)
+            # pairs among atoms of type name are only counted once
+            idx1, idx2, distances = cell_list_pairs(positions, positions, cutoff
+                                                   ,lattice, half=True)
+            pairs = [(idx1 + start, idx2 + start, distances)]
+            all_positions = self.get_positions()
+            for offset, others in [(0, all_positions[:start]), (stop, all_positions[stop:])]:
+                idx1, idx2, distances = cell_list_pairs(positions, others, cutoff, lattice)
+                pairs.append((idx1 + start, idx2 + offset, distances))
+            idx1, idx2, distances = [np.concatenate(p) for p in zip(*pairs)]
+            order = np.lexsort((idx2, idx1))
+            return idx1[order], idx2[order], distances[order]
 
         else:
-            atoms1 = self.get_atoms(name=name1)
-            atoms2 = self.get_atoms(name=name2)
-            for atom1 in atoms1:
-                for atom2 in atoms2:
-                    distances.append(pbc_distance(atom1, atom2, unit=unit
-                                                 ,lattice=self.get_lattice()))
+            start1 = self.get_species_range(name1)[0]
+            start2 = self.get_species_range(name2)[0]
+            idx1, idx2, distances = cell_list_pairs(self.get_positions(name1)
+                                                   ,self.get_positions(name2)
+                                                   ,cutoff, lattice)
+            return idx1 + start1, idx2 + start2, distances
 
-        return distances
+    def get_bond_graph(self, cutoffs):
+        """
+        Atoms are bonded when closer than the cutoff of their atom type pair
 
-    def to_trj(self, file_name='configuration.trj'):
+        return: BondGraph
+        parameters:
+            cutoffs: float or dict[string:float] | one cutoff for all pairs,
+                                                   or one per pair (e.g. 'C-O')
+        """
+        cutoffs = cutoff_matrix(self.get_atom_types(), cutoffs)
+        natom = self.get_natom()
+        if not np.any(cutoffs > 0):
+            return BondGraph(natom, np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0))
+        idx1, idx2, distances = self.get_neighbors(np.max(cutoffs))
+        species = self.get_species()
+        bonded = distances <= cutoffs[species[idx1], species[idx2]]
+        return BondGraph(natom, idx1[bonded], idx2[bonded], distances[bonded])
+
+    def get_structure_factor(self, k_max, nbins=100, memory_limit=2**27, partial=False):
+        """
+        return: tuple(np.array[float], dict[string:np.array[float]])
+                | shell centers q and S(q) for 'total' and, if partial,
+                  each atom type pair
+        parameters:
+            k_max: float | largest |k| in inverse length units
+            nbins: int | number of |k| shells
+            memory_limit: int | bytes of scratch space per block of k-vectors
+            partial: bool | also compute partial structure factors
+        """
+        return compute_structure_factor([self], k_max, nbins, memory_limit, partial)
+
+    def to_trj(self, file_name='configuration.trj', precision=10):
         """
         Write Configuration object to trj file
         parameters:
             file_name: string | name for output trj file
+            precision: int | number of decimals for reduced coordinates
+        """
+        file_tools.write_trj([self], file_name, precision)
+
+    def to_npz(self, file_name='configuration.npz'):
+        """
+        Save Configuration object as npz checkpoint, see file_tools.load_npz
         """
-        with open(file_name, 'w') as outfile:
-            outfile.write(self.trj_str().strip())
+        file_tools.save_npz(self, file_name)
 
     def to_pkl(self, file_name='configuration.pkl'):
         """
@@ -5,47 +5,660 @@ Author: Brian Boates
 
 Methods to assist with input/output file handling
 """
+import os
+import io
+import zipfile
+import multiprocessing
 import numpy as np
 import pickle
-from atom import Atom
+import instrument
 from lattice import Lattice
 from configuration import Configuration
 from simulation import Simulation
+from frames import TrjFrames
+from frames import BinFrames
+from frames import NpzFrames
 
-def read_trj(trj_file):
+def _read_lines(trj, nlines):
     """
-    return: Simulation
+    Reads lines with a few large reads instead of one readline each,
+    leaving the file positioned after the last line read
+
+    return: string | the next nlines lines of trj as one block
+    parameters:
+        trj: file | open trj file
+        nlines: int | number of lines to read
+    """
+    if nlines <= 0:
+        return ''
+    block = trj.readline()
+    # guess the block size from the first line, read more if short
+    line_size = max(1, len(block))
+    count = block.count('\n')
+    while count < nlines:
+        chunk = trj.read(line_size * (nlines - count) + line_size)
+        if not chunk:
+            return block
+        block += chunk
+        count += chunk.count('\n')
+
+    # step back from the last newline read to the nlines-th one
+    end = block.rfind('\n')
+    for i in xrange(count - nlines):
+        end = block.rfind('\n', 0, end)
+    remainder = len(block) - end - 1
+    if remainder:
+        trj.seek(-remainder, 1)
+        block = block[:end+1]
+    return block
+
+def _skip_frame(trj):
+    """
+    Advance past one frame without parsing it
+    return: bool | False if the end of the file was reached
+    parameters:
+        trj: file | open trj file
+    """
+    for i in xrange(4):
+        if not trj.readline():
+            return False
+    natom = np.sum(np.array(trj.readline().split(), dtype=int))
+    _read_lines(trj, natom)
+    instrument.count('file_tools.frames_skipped')
+    return True
+
+def _parse_positions(block, names, atom_counts):
+    """
+    Blanks out the atom type column, checking it against the header
+    counts, so that all coordinates are parsed in one np.fromstring call
+
+    return: np.array[float] | (natom, 3) positions, None if the atoms
+                              are not listed in header order
+    parameters:
+        block: string | atom records of one frame
+        names: list[string] | atom types from the frame header
+        atom_counts: list[int] | atom counts from the frame header
+    """
+    natom = np.sum(atom_counts)
+    # one mutable copy, blanked in place and parsed without another copy
+    text = bytearray(block)
+    chars = np.frombuffer(text, dtype=np.uint8)
+    newlines = np.flatnonzero(chars == ord('\n'))
+    if len(newlines) < natom - 1:
+        return None
+    starts = np.concatenate(([0], newlines[:natom-1] + 1)).astype(int)
+
+    stop = 0
+    for name, count in zip(names, atom_counts):
+        line_starts = starts[stop:stop+count]
+        stop += count
+        if len(line_starts) and line_starts[-1] + len(name) >= len(chars):
+            return None
+        columns = line_starts[:,np.newaxis] + np.arange(len(name))
+        if not np.all(chars[columns] == np.frombuffer(name, dtype=np.uint8)):
+            return None
+        if not np.all((chars[line_starts+len(name)] == ord(' '))
+                      | (chars[line_starts+len(name)] == ord('\t'))):
+            return None
+        chars[columns] = ord(' ')
+
+    positions = np.fromstring(buffer(text), sep=' ')
+    if len(positions) != 3 * natom:
+        return None
+    return positions.reshape(natom, 3)
+
+def read_frame(trj, atom_types=None):
+    """
+    The atom records of a frame are read as one block and their
+    coordinate columns converted in a single call
+
+    return: Configuration | None if the end of the file was reached
+    parameters:
+        trj: file | open trj file
+        atom_types: list[string] | only keep atoms of these types
+    """
+    with instrument.timer('file_tools.read_frame'):
+        return _read_frame(trj, atom_types)
+
+def _read_frame(trj, atom_types):
+    """
+    return: Configuration | see read_frame
+    """
+    line = trj.readline()
+    if not line:
+        return None
+    header = [line, trj.readline(), trj.readline(), trj.readline(), trj.readline()]
+    lattice_vectors = [header[0].split(), header[1].split(), header[2].split()]
+    lattice = Lattice(*np.array(lattice_vectors, dtype=float).ravel())
+
+    configuration = Configuration(lattice=lattice)
+
+    names = header[3].split()
+    atom_counts = np.array(header[4].split(), dtype=int)
+    natom = np.sum(atom_counts)
+
+    block = _read_lines(trj, natom)
+    with instrument.timer('file_tools.parse_positions'):
+        positions = _parse_positions(block, names, atom_counts)
+    instrument.count('file_tools.frames_parsed')
+    instrument.count('file_tools.atoms_parsed', natom)
+    instrument.count('file_tools.bytes_read', len(block) + sum(len(line) for line in header))
+
+    if positions is not None and len(set(names)) == len(names):
+        # atoms are listed in header order, so each type is one block
+        keep = np.array([not atom_types or name in atom_types for name in names])
+        if not np.all(keep):
+            positions = positions[np.repeat(keep, atom_counts)]
+        configuration.set_atom_positions([name for name, k in zip(names, keep) if k]
+                                        ,atom_counts[keep], positions)
+    else:
+        records = block.split()
+        positions = np.array(records[1::4] + records[2::4] + records[3::4], dtype=float)
+        positions = positions.reshape(3, natom).T
+        record_names = np.array(records[0::4])
+        for name in sorted(set(record_names), key=list(record_names).index):
+            if not atom_types or name in atom_types:
+                configuration.insert_positions(name, positions[record_names == name])
+
+    return configuration
+
+def iter_trj(trj_file, start=0, stop=None, step=1, atom_types=None):
+    """
+    Reads one frame at a time, so memory does not grow with file size
+
+    return: iterator[Configuration]
     parameters:
         trj_file: string | name of trj file
+        start: int | index of first frame to read
+        stop: int | index to stop reading at (default: end of file)
+        step: int | read every step-th frame
+        atom_types: list[string] | only keep atoms of these types
     """
-    simulation = Simulation()
     with open(trj_file, 'r') as trj:
 
+        idx = 0
+        while stop is None or idx < stop:
+
+            if idx >= start and (idx - start) % step == 0:
+                configuration = read_frame(trj, atom_types)
+                if configuration is None:
+                    break
+                yield configuration
+
+            elif not _skip_frame(trj):
+                break
+
+            idx += 1
+
+def read_trj(trj_file, start=0, stop=None, step=1, atom_types=None):
+    """
+    return: Simulation
+    parameters:
+        trj_file: string | name of trj file
+        start: int | index of first frame to read
+        stop: int | index to stop reading at (default: end of file)
+        step: int | read every step-th frame
+        atom_types: list[string] | only keep atoms of these types
+    """
+    return Simulation(iter_trj(trj_file, start, stop, step, atom_types))
+
+def write_trj(configurations, trj_file, precision=10):
+    """
+    Writes one configuration at a time, so memory does not grow with
+    the number of configurations
+
+    parameters:
+        configurations: iterable[Configuration]
+        trj_file: string or file | name of trj file or open file handle
+        precision: int | number of decimals for reduced coordinates
+    """
+    if isinstance(trj_file, basestring):
+        with open(trj_file, 'w') as outfile:
+            write_trj(configurations, outfile, precision)
+        return
+    with instrument.timer('file_tools.write_trj'):
+        for configuration in configurations:
+            s = configuration.trj_str(precision)
+            trj_file.write(s)
+            instrument.count('file_tools.frames_written')
+            instrument.count('file_tools.bytes_written', len(s))
+
+def scan_trj(trj_file):
+    """
+    return: np.array[int] | byte offset of every frame in trj file
+    parameters:
+        trj_file: string | name of trj file
+    """
+    offsets = []
+    offset = 0
+    with open(trj_file, 'rb') as trj, instrument.timer('file_tools.scan_trj'):
+
         while True:
 
             line = trj.readline()
-            if not line:
+            if not line.strip():
                 break
-            lattice = Lattice()
-            lattice.set_a(np.array(line.split(), dtype=float))
-            lattice.set_b(np.array(trj.readline().split(), dtype=float))
-            lattice.set_c(np.array(trj.readline().split(), dtype=float))
+            offsets.append(offset)
+            offset += len(line)
+            for i in xrange(3):
+                offset += len(trj.readline())
+            line = trj.readline()
+            offset += len(line)
+            natom = np.sum(np.array(line.split(), dtype=int))
+            offset += len(_read_lines(trj, natom))
+
+    instrument.count('file_tools.bytes_read', offset)
+    return np.array(offsets, dtype=np.int64)
+
+def _index_file_name(trj_file):
+    """
+    return: string | name of sidecar index file for trj_file
+    """
+    return trj_file + '.idx'
+
+def save_trj_index(trj_file, offsets, index_file=None):
+    """
+    parameters:
+        trj_file: string | name of trj file
+        offsets: np.array[int] | byte offset of every frame
+        index_file: string | name for index file (default: trj_file.idx)
+    """
+    stat = os.stat(trj_file)
+    with open(index_file or _index_file_name(trj_file), 'wb') as outfile:
+        np.savez(outfile, offsets=offsets, size=stat.st_size, mtime=stat.st_mtime)
+
+def load_trj_index(trj_file, index_file=None):
+    """
+    return: np.array[int] | byte offset of every frame, None if the index
+                            is missing or out of date with trj_file
+    parameters:
+        trj_file: string | name of trj file
+        index_file: string | name of index file (default: trj_file.idx)
+    """
+    index_file = index_file or _index_file_name(trj_file)
+    if not os.path.exists(index_file):
+        return None
+    stat = os.stat(trj_file)
+    with open(index_file, 'rb') as infile:
+        index = np.load(infile)
+        if index['size'] != stat.st_size or index['mtime'] != stat.st_mtime:
+            return None
+        return index['offsets']
 
-            configuration = Configuration(lattice=lattice)
+def index_trj(trj_file, index_file=None):
+    """
+    Loads the frame index of trj_file, scanning the file and saving the
+    index on first use or when the trj file has changed
 
-            atom_types = trj.readline().split()
-            atom_counts = np.array(trj.readline().split(), dtype=int)
-            natom = np.sum(atom_counts)
+    return: np.array[int] | byte offset of every frame
+    parameters:
+        trj_file: string | name of trj file
+        index_file: string | name of index file (default: trj_file.idx)
+    """
+    offsets = load_trj_index(trj_file, index_file)
+    if offsets is None:
+        offsets = scan_trj(trj_file)
+        save_trj_index(trj_file, offsets, index_file)
+    return offsets
 
-            for i in xrange(natom):
-                atom_record = trj.readline().split()
-                atom_name = atom_record[0]
-                atom_position = np.array(atom_record[1:], dtype=float)
-                configuration.insert_atom(Atom(atom_name, atom_position))
+def open_trj(trj_file, atom_types=None, timestep=None, index_file=None):
+    """
+    Frames are only read from disk when accessed
 
-            simulation.insert_configuration(configuration)
+    return: Simulation | lazily loaded from trj file
+    parameters:
+        trj_file: string | name of trj file
+        atom_types: list[string] | only keep atoms of these types
+        timestep: float
+        index_file: string | name of index file (default: trj_file.idx)
+    """
+    frames = TrjFrames(trj_file, index_trj(trj_file, index_file), atom_types)
+    return Simulation(frames=frames, timestep=timestep)
+
+# binary trajectory layout: a fixed header, the atom type names and
+# counts, padding to a 64 byte boundary, then one record per frame
+# holding the (3, 3) lattice and the (natom, 3) reduced positions
+BIN_MAGIC = 'PYMODABT'
+BIN_VERSION = 1
+_BIN_HEADER = np.dtype([('magic', 'S8'), ('version', '<i8'), ('nframes', '<i8')
+                       ,('natom', '<i8'), ('ntypes', '<i8'), ('dtype', 'S8')])
+_BIN_NAME = np.dtype('S16')
+_BIN_ALIGN = 64
+
+def bin_frame_dtype(natom, dtype='<f8'):
+    """
+    return: np.dtype | record of one frame in a binary trajectory
+    parameters:
+        natom: int | number of atoms per frame
+        dtype: string | float type of the positions
+    """
+    return np.dtype([('lattice', '<f8', (3, 3)), ('positions', dtype, (natom, 3))])
+
+def read_bin_header(bin_file):
+    """
+    return: dict | nframes, natom, names, counts, dtype and data offset
+    parameters:
+        bin_file: string | name of binary trajectory file
+    """
+    with open(bin_file, 'rb') as infile:
+        header = np.fromfile(infile, dtype=_BIN_HEADER, count=1)[0]
+        if header['magic'] != BIN_MAGIC:
+            raise ValueError, '%s is not a binary trajectory file' % bin_file
+        if header['version'] > BIN_VERSION:
+            raise ValueError, 'unsupported binary trajectory version %s' % header['version']
+        ntypes = int(header['ntypes'])
+        names = np.fromfile(infile, dtype=_BIN_NAME, count=ntypes)
+        counts = np.fromfile(infile, dtype='<i8', count=ntypes)
+    size = _BIN_HEADER.itemsize + ntypes * (_BIN_NAME.itemsize + 8)
+    return {'nframes': int(header['nframes']), 'natom': int(header['natom'])
+           ,'names': list(names), 'counts': [int(count) for count in counts]
+           ,'dtype': header['dtype'], 'offset': size + (-size % _BIN_ALIGN)}
 
-    return simulation
+@instrument.timed('file_tools.write_bin')
+def write_bin(configurations, bin_file, dtype='<f8'):
+    """
+    Frames are written one at a time, all must have the same atoms
+
+    parameters:
+        configurations: iterable[Configuration]
+        bin_file: string | name for binary trajectory file
+        dtype: string | float type to store positions as
+    """
+    with open(bin_file, 'wb') as outfile:
+
+        nframes = 0
+        atom_types = None
+        for configuration in configurations:
+
+            if atom_types is None:
+                atom_types = _atom_types(configuration)
+                _write_bin_header(outfile, atom_types, 0, dtype)
+                record = np.zeros(1, dtype=bin_frame_dtype(configuration.get_natom(), dtype))
+
+            _set_bin_record(record[0], configuration, atom_types)
+            record.tofile(outfile)
+            nframes += 1
+
+        if atom_types is None:
+            raise ValueError, 'no configurations to write'
+
+        outfile.seek(0)
+        _write_bin_header(outfile, atom_types, nframes, dtype)
+
+def _atom_types(configuration):
+    """
+    return: list[tuple(string, int)] | atom types and their counts
+    parameters:
+        configuration: Configuration
+    """
+    return [(name, configuration.get_natom(name)) for name in configuration.get_atom_types()]
+
+def _write_bin_header(outfile, atom_types, nframes, dtype):
+    """
+    Writes the header, leaving outfile at the first frame record
+    parameters:
+        outfile: file | binary trajectory file open for writing
+        atom_types: list[tuple(string, int)] | atom types and their counts
+        nframes: int | number of frames
+        dtype: string | float type of the positions
+    """
+    header = np.zeros(1, dtype=_BIN_HEADER)
+    header['magic'] = BIN_MAGIC
+    header['version'] = BIN_VERSION
+    header['nframes'] = nframes
+    header['natom'] = sum(count for name, count in atom_types)
+    header['ntypes'] = len(atom_types)
+    header['dtype'] = np.dtype(dtype).str
+    header.tofile(outfile)
+    np.array([name for name, count in atom_types], dtype=_BIN_NAME).tofile(outfile)
+    np.array([count for name, count in atom_types], dtype='<i8').tofile(outfile)
+    outfile.write('\0' * (-outfile.tell() % _BIN_ALIGN))
+
+def _set_bin_record(record, configuration, atom_types):
+    """
+    parameters:
+        record: np.void | binary trajectory frame record
+        configuration: Configuration
+        atom_types: list[tuple(string, int)] | atom types and their counts
+    """
+    if _atom_types(configuration) != atom_types:
+        raise ValueError, 'all frames must have the same atom types and counts'
+    lattice = configuration.get_lattice()
+    record['lattice'] = lattice.get_matrix()
+    record['positions'] = configuration.get_positions()
+
+def open_bin(bin_file, timestep=None):
+    """
+    Frames are memory-mapped, nothing is read until accessed
+
+    return: Simulation | backed by binary trajectory file
+    parameters:
+        bin_file: string | name of binary trajectory file
+        timestep: float
+    """
+    return Simulation(frames=BinFrames(bin_file), timestep=timestep)
+
+def trj_to_bin(trj_file, bin_file, dtype='<f8'):
+    """
+    parameters:
+        trj_file: string | name of trj file
+        bin_file: string | name for binary trajectory file
+        dtype: string | float type to store positions as
+    """
+    write_bin(iter_trj(trj_file), bin_file, dtype)
+
+def bin_to_trj(bin_file, trj_file):
+    """
+    parameters:
+        bin_file: string | name of binary trajectory file
+        trj_file: string | name for trj file
+    """
+    write_trj(BinFrames(bin_file), trj_file)
+
+def _read_frame_range(args):
+    """
+    Worker for read_trj_parallel: parses a run of frames and writes
+    them into their records of the memory-mapped binary file
+
+    return: int | number of frames parsed
+    parameters:
+        args: tuple | trj_file, bin_file, offsets of the frames,
+                      index of the first frame, expected atom types
+    """
+    trj_file, bin_file, offsets, first, atom_types = args
+    records = BinFrames(bin_file, mode='r+')._records
+    with open(trj_file, 'rb') as trj:
+        trj.seek(offsets[0])
+        for idx in xrange(len(offsets)):
+            # frames of a range are contiguous, so no seek is needed
+            _set_bin_record(records[first+idx], read_frame(trj), atom_types)
+    records.flush()
+    return len(offsets)
+
+@instrument.timed('file_tools.read_trj_parallel')
+def read_trj_parallel(trj_file, bin_file=None, nprocs=None, index_file=None
+                     ,dtype='<f8', overwrite=False):
+    """
+    Splits trj_file into frame-aligned byte ranges and parses them in
+    a process pool. Workers write positions straight into a
+    memory-mapped binary trajectory file, in frame order.
+    All frames must have the same atom types and counts.
+
+    return: Simulation | backed by the binary trajectory file
+    parameters:
+        trj_file: string | name of trj file
+        bin_file: string | name for binary trajectory file
+                           (default: trj_file with a .bin extension)
+        nprocs: int | number of worker processes (default: cpu count)
+        index_file: string | name of index file (default: trj_file.idx)
+        dtype: string | float type to store positions as
+        overwrite: bool | replace bin_file if it already exists
+    """
+    bin_file = bin_file or os.path.splitext(trj_file)[0] + '.bin'
+    if os.path.exists(bin_file) and not overwrite:
+        raise IOError, '%s already exists, pass overwrite=True to replace it' % bin_file
+    nprocs = nprocs or multiprocessing.cpu_count()
+    offsets = index_trj(trj_file, index_file)
+    if not len(offsets):
+        raise ValueError, 'no frames in %s' % trj_file
+
+    with open(trj_file, 'rb') as trj:
+        first_frame = read_frame(trj)
+    atom_types = _atom_types(first_frame)
+    record_size = bin_frame_dtype(first_frame.get_natom(), dtype).itemsize
+    with open(bin_file, 'wb') as outfile:
+        _write_bin_header(outfile, atom_types, len(offsets), dtype)
+        outfile.truncate(outfile.tell() + len(offsets) * record_size)
+
+    nranges = min(nprocs, len(offsets))
+    bounds = np.linspace(0, len(offsets), nranges+1).astype(int)
+    ranges = [(trj_file, bin_file, offsets[start:stop], start, atom_types)
+              for start, stop in zip(bounds[:-1], bounds[1:])]
+    if nprocs == 1:
+        map(_read_frame_range, ranges)
+    else:
+        pool = multiprocessing.Pool(nranges)
+        try:
+            pool.map(_read_frame_range, ranges)
+        finally:
+            pool.close()
+            pool.join()
+
+    return open_bin(bin_file)
+
+NPZ_SCHEMA = 'pymoda'
+NPZ_VERSION = 1
+
+def npz_positions_key(species_idx, frame_idx=None):
+    """
+    Positions are stored one atom type (and one frame) per array, so
+    each can be loaded on its own
+
+    return: string | npz key of an atom type's positions
+    parameters:
+        species_idx: int | index into the stored atom types
+        frame_idx: int | frame index (None for a Configuration)
+    """
+    if frame_idx is None:
+        return 'positions_%d' % species_idx
+    return 'positions_%d_%d' % (frame_idx, species_idx)
+
+def _write_npz_arrays(npz_file, arrays):
+    """
+    Writes an uncompressed npz one array at a time, so only one array
+    is held in memory
+
+    parameters:
+        npz_file: string | name for npz file
+        arrays: iterable[tuple(string, np.array)] | keys and arrays
+    """
+    with zipfile.ZipFile(npz_file, 'w', zipfile.ZIP_STORED, allowZip64=True) as npz:
+        for key, array in arrays:
+            buf = io.BytesIO()
+            np.lib.format.write_array(buf, np.asanyarray(array))
+            npz.writestr(key + '.npy', buf.getvalue())
+
+def _npz_header(kind):
+    """
+    return: list[tuple(string, np.array)]
+    """
+    return [('schema', np.array(NPZ_SCHEMA)), ('version', np.array(NPZ_VERSION))
+           ,('kind', np.array(kind))]
+
+def _npz_configuration_arrays(configuration):
+    """
+    return: iterator[tuple(string, np.array)]
+    """
+    names = configuration.get_atom_types()
+    yield 'lattice', configuration.get_lattice().get_matrix()
+    yield 'names', np.array(names, dtype='S')
+    yield 'counts', np.array([configuration.get_natom(name) for name in names], dtype=int)
+    for species_idx, name in enumerate(names):
+        yield npz_positions_key(species_idx), configuration.get_positions(name)
+
+def _npz_simulation_arrays(simulation):
+    """
+    Frames are streamed, the lattices are written after the last one
+
+    return: iterator[tuple(string, np.array)]
+    """
+    timestep = simulation.get_timestep()
+    yield 'timestep', np.array([] if timestep is None else [timestep], dtype=float)
+    atom_types, lattices = None, []
+    for frame_idx, configuration in enumerate(simulation):
+        if atom_types is None:
+            atom_types = _atom_types(configuration)
+        elif _atom_types(configuration) != atom_types:
+            raise ValueError, 'all frames must have the same atom types and counts'
+        lattices.append(configuration.get_lattice().get_matrix())
+        for species_idx, name in enumerate(configuration.get_atom_types()):
+            yield npz_positions_key(species_idx, frame_idx), configuration.get_positions(name)
+    atom_types = atom_types or []
+    yield 'names', np.array([name for name, count in atom_types], dtype='S')
+    yield 'counts', np.array([count for name, count in atom_types], dtype=int)
+    yield 'lattices', np.array(lattices, dtype=float).reshape(-1, 3, 3)
+
+@instrument.timed('file_tools.save_npz')
+def save_npz(obj, npz_file):
+    """
+    Checkpoints a Lattice, Configuration or Simulation as plain arrays
+    with a schema version, see load_npz
+
+    parameters:
+        obj: Lattice, Configuration or Simulation
+        npz_file: string | name for npz file
+    """
+    if isinstance(obj, Lattice):
+        arrays = _npz_header('lattice') + [('lattice', obj.get_matrix())]
+    elif isinstance(obj, Configuration):
+        arrays = _npz_header('configuration') + list(_npz_configuration_arrays(obj))
+    elif isinstance(obj, Simulation):
+        arrays = _npz_header('simulation')
+        arrays = (item for items in (arrays, _npz_simulation_arrays(obj)) for item in items)
+    else:
+        raise ValueError, 'obj must be a Lattice, Configuration or Simulation'
+    _write_npz_arrays(npz_file, arrays)
+
+def read_npz_header(npz):
+    """
+    return: string | kind of object stored ('lattice', 'configuration'
+                     or 'simulation')
+    parameters:
+        npz: NpzFile | from np.load
+    """
+    if 'schema' not in npz.files or str(npz['schema']) != NPZ_SCHEMA:
+        raise ValueError, 'not a pymoda npz file'
+    if int(npz['version']) > NPZ_VERSION:
+        raise ValueError, 'npz version %s is newer than %s' % (int(npz['version']), NPZ_VERSION)
+    return str(npz['kind'])
+
+def load_npz(npz_file, atom_types=None):
+    """
+    Simulations are loaded lazily: only the lattices are read, and each
+    frame's positions when it is accessed
+
+    return: Lattice, Configuration or Simulation
+    parameters:
+        npz_file: string | name of npz file
+        atom_types: list[string] | only load atoms of these types
+    """
+    npz = np.load(npz_file)
+    kind = read_npz_header(npz)
+    if kind == 'lattice':
+        return Lattice(*npz['lattice'].ravel())
+    elif kind == 'configuration':
+        names = npz['names'].tolist()
+        configuration = Configuration(lattice=Lattice(*npz['lattice'].ravel()))
+        for species_idx, name in enumerate(names):
+            if atom_types is None or name in atom_types:
+                configuration.insert_positions(name, npz[npz_positions_key(species_idx)])
+        return configuration
+    elif kind == 'simulation':
+        timestep = npz['timestep']
+        return Simulation(frames=NpzFrames(npz_file, atom_types)
+                         ,timestep=float(timestep[0]) if len(timestep) else None)
+    else:
+        raise ValueError, 'unknown npz kind %s' % kind
 
 def load_pkl(file_name):
     """
@@ -53,7 +666,7 @@ def load_pkl(file_name):
     parameters:
         file_name: string | name of pickle file
     """
-    with open(file_name, 'r') as infile:
+    with open(file_name, 'rb') as infile:
         obj = pickle.load(infile)
     return obj
 
@@ -63,6 +676,6 @@ def save_pkl(obj, file_name):
         obj: object to save to pickle file
         file_name: string | name for pickle file
     """
-    with open(file_name, 'w') as outfile:
-        pickle.dump(obj, file_name)
+    with open(file_name, 'wb') as outfile:
+        pickle.dump(obj, outfile, pickle.HIGHEST_PROTOCOL)
 
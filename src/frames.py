@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+frames.py
+Author: Brian Boates
+
+Implements TrjFrames(), BinFrames() and NpzFrames()
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+import file_tools
+from result_cache import fingerprint_file
+from result_cache import fingerprint_strings
+from result_cache import fingerprint_arrays
+from lattice import Lattice
+from configuration import Configuration
+
+class TrjFrames(object):
+    """
+    Sequence of configurations read lazily from a trj file, seeking to
+    each frame through its byte offset
+    """
+    def __init__(self, trj_file, offsets, atom_types=None):
+        """
+        parameters:
+            trj_file: string | name of trj file
+            offsets: np.array[int] | byte offset of every frame
+            atom_types: list[string] | only keep atoms of these types
+        """
+        self._trj_file = trj_file
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._atom_types = atom_types
+
+    def __str__(self):
+        """
+        return: string
+        """
+        s = '<TrjFrames: trj_file=%s, num_frames=%s>' % (self._trj_file, len(self))
+        return s
+
+    def __repr__(self):
+        """
+        return: string
+        """
+        return self.__str__()
+
+    def __len__(self):
+        """
+        return: int
+        """
+        return len(self._offsets)
+
+    def __getitem__(self, idx):
+        """
+        return: Configuration | TrjFrames if idx is a slice
+        parameters:
+            idx: int or slice | frame index
+        """
+        if isinstance(idx, slice):
+            return TrjFrames(self._trj_file, self._offsets[idx], self._atom_types)
+        with open(self._trj_file, 'rb') as trj:
+            trj.seek(self._offsets[idx])
+            return file_tools.read_frame(trj, self._atom_types)
+
+    def __iter__(self):
+        """
+        return: iterator[Configuration]
+        """
+        with open(self._trj_file, 'rb') as trj:
+            for offset in self._offsets:
+                trj.seek(offset)
+                yield file_tools.read_frame(trj, self._atom_types)
+
+    def get_fingerprint(self):
+        """
+        return: string | digest of the trj file, frames and atom types
+        """
+        return fingerprint_strings([fingerprint_file(self._trj_file)
+                                   ,fingerprint_arrays([self._offsets])
+                                   ,repr(self._atom_types)])
+
+
+class BinFrames(object):
+    """
+    Sequence of configurations memory-mapped from a binary trajectory
+    file, slicing frames or atoms does not read anything
+    """
+    def __init__(self, bin_file, mode='r'):
+        """
+        parameters:
+            bin_file: string | name of binary trajectory file
+            mode: string | 'r' (default) for read-only, 'r+' to allow writes
+        """
+        header = file_tools.read_bin_header(bin_file)
+        self._bin_file = bin_file
+        self._names = header['names']
+        self._counts = header['counts']
+        self._fingerprint = None
+        self._records = np.memmap(bin_file, mode=mode, offset=header['offset']
+                                 ,shape=(header['nframes'],)
+                                 ,dtype=file_tools.bin_frame_dtype(header['natom']
+                                                                  ,header['dtype']))
+
+    def __str__(self):
+        """
+        return: string
+        """
+        s = '<BinFrames: bin_file=%s, num_frames=%s>' % (self._bin_file, len(self))
+        return s
+
+    def __repr__(self):
+        """
+        return: string
+        """
+        return self.__str__()
+
+    def __len__(self):
+        """
+        return: int
+        """
+        return len(self._records)
+
+    def __getitem__(self, idx):
+        """
+        return: Configuration | BinFrames if idx is a slice
+        parameters:
+            idx: int or slice | frame index
+        """
+        if isinstance(idx, slice):
+            frames = BinFrames(self._bin_file)
+            frames._records = self._records[idx]
+            frames._fingerprint = None
+            return frames
+
+        record = self._records[idx]
+        configuration = Configuration(lattice=Lattice(*record['lattice'].ravel()))
+        start = 0
+        for name, count in zip(self._names, self._counts):
+            configuration.insert_positions(name, record['positions'][start:start+count])
+            start += count
+        return configuration
+
+    def __iter__(self):
+        """
+        return: iterator[Configuration]
+        """
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+    def get_atom_types(self):
+        """
+        return: list[string]
+        """
+        return list(self._names)
+
+    def get_lattices(self):
+        """
+        return: np.array[float] | (nframes, 3, 3) memory-mapped lattice vectors
+        """
+        return self._records['lattice']
+
+    def get_positions(self, name=None):
+        """
+        return: np.array[float] | (nframes, natom, 3) memory-mapped reduced coordinates
+        parameters:
+            name: string | type of atoms to get
+        """
+        positions = self._records['positions']
+        if not name:
+            return positions
+        idx = self._names.index(name)
+        start = sum(self._counts[:idx])
+        return positions[:,start:start+self._counts[idx]]
+
+    def get_fingerprint(self):
+        """
+        return: string | digest of the frame records, computed once
+                         unless the file is open for writing
+        """
+        if self._fingerprint is None or self._records.flags.writeable:
+            self._fingerprint = fingerprint_arrays([np.array(self._names, dtype='S')
+                                                   ,np.array(self._counts), self._records])
+        return self._fingerprint
+
+
+class NpzFrames(object):
+    """
+    Sequence of configurations loaded lazily from a simulation npz
+    checkpoint, reading only the positions of the frames and atom types
+    that are accessed
+    """
+    def __init__(self, npz_file, atom_types=None, frame_idx=None):
+        """
+        parameters:
+            npz_file: string | name of npz file written by file_tools.save_npz
+            atom_types: list[string] | only load atoms of these types
+            frame_idx: np.array[int] | stored frames to use (default: all)
+        """
+        npz = np.load(npz_file)
+        if file_tools.read_npz_header(npz) != 'simulation':
+            raise ValueError, 'npz file does not hold a simulation'
+        self._npz_file = npz_file
+        self._npz = npz
+        self._atom_types = atom_types
+        self._all_names = npz['names'].tolist()
+        self._lattices = npz['lattices']
+        if frame_idx is None:
+            frame_idx = np.arange(len(self._lattices))
+        self._frame_idx = np.asarray(frame_idx, dtype=int)
+        counts = npz['counts']
+        self._species = [(idx, name, count)
+                         for idx, (name, count) in enumerate(zip(self._all_names, counts))
+                         if atom_types is None or name in atom_types]
+
+    def __str__(self):
+        """
+        return: string
+        """
+        s = '<NpzFrames: npz_file=%s, num_frames=%s>' % (self._npz_file, len(self))
+        return s
+
+    def __repr__(self):
+        """
+        return: string
+        """
+        return self.__str__()
+
+    def __getstate__(self):
+        """
+        return: dict | state for pickling, the npz file is reopened
+        """
+        return {'npz_file': self._npz_file, 'atom_types': self._atom_types
+               ,'frame_idx': self._frame_idx}
+
+    def __setstate__(self, state):
+        """
+        parameters:
+            state: dict | from __getstate__
+        """
+        self.__init__(state['npz_file'], state['atom_types'], state['frame_idx'])
+
+    def __len__(self):
+        """
+        return: int
+        """
+        return len(self._frame_idx)
+
+    def __getitem__(self, idx):
+        """
+        return: Configuration | NpzFrames if idx is a slice
+        parameters:
+            idx: int or slice | frame index
+        """
+        if isinstance(idx, slice):
+            return NpzFrames(self._npz_file, self._atom_types, self._frame_idx[idx])
+
+        frame_idx = self._frame_idx[idx]
+        configuration = Configuration(lattice=Lattice(*self._lattices[frame_idx].ravel()))
+        for species_idx, name, count in self._species:
+            key = file_tools.npz_positions_key(species_idx, frame_idx)
+            configuration.insert_positions(name, self._npz[key])
+        return configuration
+
+    def __iter__(self):
+        """
+        return: iterator[Configuration]
+        """
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+    def get_atom_types(self):
+        """
+        return: list[string]
+        """
+        return [name for species_idx, name, count in self._species]
+
+    def get_lattices(self):
+        """
+        return: np.array[float] | (nframes, 3, 3) lattice vectors as rows
+        """
+        return self._lattices[self._frame_idx]
+
+    def get_positions(self, name=None):
+        """
+        Only the arrays of the requested atom type are read
+
+        return: np.array[float] | (nframes, natom, 3) reduced coordinates
+        parameters:
+            name: string | type of atoms to get
+        """
+        species = [s for s in self._species if not name or s[1] == name]
+        natom = sum(count for species_idx, species_name, count in species)
+        positions = np.empty((len(self), natom, 3))
+        for i, frame_idx in enumerate(self._frame_idx):
+            start = 0
+            for species_idx, species_name, count in species:
+                key = file_tools.npz_positions_key(species_idx, frame_idx)
+                positions[i,start:start+count] = self._npz[key]
+                start += count
+        return positions
+
+    def get_fingerprint(self):
+        """
+        return: string | digest of the npz file, frames and atom types
+        """
+        return fingerprint_strings([fingerprint_file(self._npz_file)
+                                   ,fingerprint_arrays([self._frame_idx])
+                                   ,repr(self._atom_types)])
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+instrument.py
+Author: Brian Boates
+
+Named timers and counters for finding where an analysis spends its
+time (e.g. parsing, coordinate conversion, pair enumeration, output).
+
+Off by default, when timers and counters do no more than check a flag.
+Turn on by setting the PYMODA_INSTRUMENT environment variable, with
+enable(), or for a block of code:
+
+    with instrument.instrumented():
+        simulation = file_tools.read_trj('run.trj')
+        simulation.get_rdf(6.0)
+    print instrument.summary()
+
+Setting PYMODA_PROFILE_STAGE (and optionally PYMODA_PROFILE_FILE) to a
+timer name dumps cProfile data for that stage, see profile_stage().
+Work done in worker processes (nprocs > 1) is not recorded.
+"""
+import sys
+sys.dont_write_bytecode = True
+import os
+import cProfile
+import functools
+import contextlib
+import timeit
+
+_enabled = bool(os.environ.get('PYMODA_INSTRUMENT'))
+
+# timer name -> [number of calls, total seconds]
+_timers = {}
+
+# counter name -> total
+_counters = {}
+
+# callables receiving (kind, name, value) for every timer and counter event
+_sinks = []
+
+# stage profiled with cProfile: [timer name, file name, cProfile.Profile]
+_profile = [os.environ.get('PYMODA_PROFILE_STAGE'), os.environ.get('PYMODA_PROFILE_FILE'), None]
+
+def is_enabled():
+    """
+    return: bool
+    """
+    return _enabled
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def reset():
+    """
+    Clears all timers and counters
+    """
+    _timers.clear()
+    _counters.clear()
+
+def add_sink(sink):
+    """
+    parameters:
+        sink: callable | called as sink(kind, name, value) with kind
+                         'timer' (value in seconds) or 'counter'
+    """
+    _sinks.append(sink)
+
+def remove_sink(sink):
+    """
+    parameters:
+        sink: callable | previously added with add_sink
+    """
+    _sinks.remove(sink)
+
+def profile_stage(name, file_name=None):
+    """
+    Profiles every run of timer name with cProfile, dumping the
+    accumulated stats to file_name after each run (e.g. for pstats or
+    snakeviz)
+
+    parameters:
+        name: string | timer name (None to stop profiling)
+        file_name: string | name for stats file (default: name + '.prof')
+    """
+    _profile[:] = [name, file_name, None]
+
+def count(name, value=1):
+    """
+    parameters:
+        name: string | counter name (e.g. 'file_tools.bytes_read')
+        value: int | added to the counter
+    """
+    if not _enabled:
+        return
+    _counters[name] = _counters.get(name, 0) + value
+    for sink in _sinks:
+        sink('counter', name, value)
+
+
+class _NullTimer(object):
+    """
+    Shared timer used while instrumentation is disabled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+    """
+    Adds the time spent in a with block to a named timer
+    """
+    def __init__(self, name):
+        """
+        parameters:
+            name: string | timer name
+        """
+        self._name = name
+        self._profiler = None
+        self._start = None
+
+    def __enter__(self):
+        if _profile[0] == self._name:
+            if _profile[2] is None:
+                _profile[2] = cProfile.Profile()
+            self._profiler = _profile[2]
+            self._profiler.enable()
+        self._start = timeit.default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = timeit.default_timer() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(_profile[1] or self._name + '.prof')
+        timer = _timers.setdefault(self._name, [0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        for sink in _sinks:
+            sink('timer', self._name, seconds)
+        return False
+
+def timer(name):
+    """
+    return: context manager timing its block under name
+    parameters:
+        name: string | timer name (e.g. 'file_tools.read_frame')
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+def timed(name):
+    """
+    return: decorator timing each call of a function under name
+    parameters:
+        name: string | timer name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextlib.contextmanager
+def instrumented(clear=True, profile=None, profile_file=None):
+    """
+    Enables instrumentation for a with block, restoring the previous
+    state afterwards
+
+    parameters:
+        clear: bool | reset timers and counters first
+        profile: string | timer name to profile with cProfile
+        profile_file: string | name for stats file (default: profile + '.prof')
+    """
+    was_enabled = _enabled
+    previous_profile = list(_profile)
+    if clear:
+        reset()
+    if profile:
+        profile_stage(profile, profile_file)
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+        _profile[:] = previous_profile
+
+def get_timers():
+    """
+    return: dict[string:tuple(int, float)] | number of calls and total
+                                             seconds of each timer
+    """
+    return dict((name, tuple(value)) for name, value in _timers.items())
+
+def get_counters():
+    """
+    return: dict[string:int]
+    """
+    return dict(_counters)
+
+def summary():
+    """
+    return: string | timers by total time, then counters
+    """
+    s = '%-40s %10s %12s %12s\n' % ('timer', 'calls', 'total (s)', 'mean (ms)')
+    for name, (calls, seconds) in sorted(_timers.items(), key=lambda item: -item[1][1]):
+        s += '%-40s %10d %12.4f %12.4f\n' % (name, calls, seconds, 1000.0 * seconds / calls)
+    s += '%-40s %10s\n' % ('counter', 'total')
+    for name in sorted(_counters):
+        s += '%-40s %10d\n' % (name, _counters[name])
+    return s
@@ -16,15 +16,14 @@ class Lattice(object):
     def __init__(self, ax=None, ay=None, az=None
                      , bx=None, by=None, bz=None
                      , cx=None, cy=None, cz=None):
-        self._ax = float(ax)
-        self._ay = float(ay)
-        self._az = float(az)
-        self._bx = float(bx)
-        self._by = float(by)
-        self._bz = float(bz)
-        self._cx = float(cx)
-        self._cy = float(cy)
-        self._cz = float(cz)
+        """
+        The lattice vectors are kept as the rows of a read-only (3, 3)
+        matrix. Derived quantities are computed once and cached until
+        a setter replaces the matrix.
+        """
+        self._set_matrix([[float(ax), float(ay), float(az)]
+                         ,[float(bx), float(by), float(bz)]
+                         ,[float(cx), float(cy), float(cz)]])
 
     def __str__(self):
         """
@@ -51,147 +50,245 @@ class Lattice(object):
         s += '%s %s %s\n' % (self.get_cx(), self.get_cy(), self.get_cz())
         return s
 
+    def __getstate__(self):
+        """
+        return: dict | only the matrix is pickled, caches are rebuilt
+        """
+        return {'_matrix': np.array(self._matrix)}
+
+    def __setstate__(self, state):
+        """
+        parameters:
+            state: dict | from __getstate__
+        """
+        self._set_matrix(state['_matrix'])
+
     def set_ax(self, ax):
-        self._ax = ax
+        self._set_element(0, 0, ax)
 
     def set_ay(self, ay):
-        self._ay = ay
+        self._set_element(0, 1, ay)
 
     def set_az(self, az):
-        self._az = az
+        self._set_element(0, 2, az)
 
     def set_bx(self, bx):
-        self._bx = bx
+        self._set_element(1, 0, bx)
 
     def set_by(self, by):
-        self._by = by
+        self._set_element(1, 1, by)
 
     def set_bz(self, bz):
-        self._bz = bz
+        self._set_element(1, 2, bz)
 
     def set_cx(self, cx):
-        self._cx = cx
+        self._set_element(2, 0, cx)
 
     def set_cy(self, cy):
-        self._cy = cy
+        self._set_element(2, 1, cy)
 
     def set_cz(self, cz):
-        self._cz = cz
+        self._set_element(2, 2, cz)
 
     def get_ax(self):
         """
         return: float
         """
-        return self._ax
+        return float(self._matrix[0,0])
 
     def get_ay(self):
         """
         return: float
         """
-        return self._ay
+        return float(self._matrix[0,1])
 
     def get_az(self):
         """
         return: float
         """
-        return self._az
+        return float(self._matrix[0,2])
 
     def get_bx(self):
         """
         return: float
         """
-        return self._bx
+        return float(self._matrix[1,0])
 
     def get_by(self):
         """
         return: float
         """
-        return self._by
+        return float(self._matrix[1,1])
 
     def get_bz(self):
         """
         return: float
         """
-        return self._bz
+        return float(self._matrix[1,2])
 
     def get_cx(self):
         """
         return: float
         """
-        return self._cx
+        return float(self._matrix[2,0])
 
     def get_cy(self):
         """
         return: float
         """
-        return self._cy
+        return float(self._matrix[2,1])
 
     def get_cz(self):
         """
         return: float
         """
-        return self._cz
+        return float(self._matrix[2,2])
+
+    def _set_matrix(self, matrix):
+        """
+        parameters:
+            matrix: np.array[float] | (3, 3) lattice vectors as rows
+        """
+        self._matrix = np.array(matrix, dtype=float).reshape(3, 3)
+        self._matrix.flags.writeable = False
+        self._cache = {}
+
+    def _set_element(self, i, j, value):
+        matrix = self._matrix.copy()
+        matrix[i,j] = value
+        self._set_matrix(matrix)
+
+    def _cached(self, key, compute):
+        """
+        return: value of compute() for the current matrix
+        """
+        if key not in self._cache:
+            value = compute()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self._cache[key] = value
+        return self._cache[key]
 
     def set_a(self, a_vector):
-        self.set_ax(a_vector[0])
-        self.set_ay(a_vector[1])
-        self.set_az(a_vector[2])
+        matrix = self._matrix.copy()
+        matrix[0] = a_vector[:3]
+        self._set_matrix(matrix)
 
     def set_b(self, b_vector):
-        self.set_bx(b_vector[0])
-        self.set_by(b_vector[1])
-        self.set_bz(b_vector[2])
+        matrix = self._matrix.copy()
+        matrix[1] = b_vector[:3]
+        self._set_matrix(matrix)
 
     def set_c(self, c_vector):
-        self.set_cx(c_vector[0])
-        self.set_cy(c_vector[1])
-        self.set_cz(c_vector[2])
+        matrix = self._matrix.copy()
+        matrix[2] = c_vector[:3]
+        self._set_matrix(matrix)
 
     def get_a(self):
         """
         return: np.array | length 3
         """
-        return np.array([self.get_ax(), self.get_ay(), self.get_az()])
+        return self._matrix[0].copy()
 
     def get_b(self):
         """
         return: np.array | length 3
         """
-        return np.array([self.get_bx(), self.get_by(), self.get_bz()])
+        return self._matrix[1].copy()
 
     def get_c(self):
         """
         return: np.array | length 3
         """
-        return np.array([self.get_cx(), self.get_cy(), self.get_cz()])
+        return self._matrix[2].copy()
+
+    def get_matrix(self):
+        """
+        return: np.array[float] | read-only (3, 3) lattice vectors as rows
+        """
+        return self._matrix
+
+    def get_inverse(self):
+        """
+        return: np.array[float] | read-only (3, 3) inverse of get_matrix()
+        """
+        return self._cached('inverse', lambda: np.linalg.inv(self._matrix))
+
+    def get_reciprocal(self):
+        """
+        return: np.array[float] | read-only (3, 3) reciprocal lattice vectors
+                                  as rows, with a_i . b_j = 2 pi delta_ij
+        """
+        return self._cached('reciprocal', lambda: 2 * np.pi * self.get_inverse().T)
+
+    def get_metric(self):
+        """
+        return: np.array[float] | read-only (3, 3) metric tensor of dot
+                                  products between lattice vectors
+        """
+        return self._cached('metric', lambda: np.dot(self._matrix, self._matrix.T))
+
+    def is_orthogonal(self):
+        """
+        return: bool | True if the lattice vectors are mutually orthogonal
+        """
+        def compute():
+            metric = self.get_metric()
+            off_diagonal = metric - np.diag(np.diag(metric))
+            return np.allclose(off_diagonal, 0.0, atol=1e-12*np.max(np.abs(metric)))
+        return self._cached('orthogonal', compute)
+
+    def perpendicular_widths(self):
+        """
+        return: np.array[float] | read-only distances between opposite faces
+                                  of the cell
+        """
+        def compute():
+            normals = np.cross(np.roll(self._matrix, -1, axis=0)
+                              ,np.roll(self._matrix, -2, axis=0))
+            return self.volume() / np.sqrt(np.sum(normals**2, axis=1))
+        return self._cached('widths', compute)
+
+    def to_cartesian(self, positions):
+        """
+        return: np.array[float] | (N, 3) cartesian coordinates
+        parameters:
+            positions: np.array[float] | (N, 3) reduced coordinates
+        """
+        return np.dot(positions, self._matrix)
+
+    def to_reduced(self, positions):
+        """
+        return: np.array[float] | (N, 3) reduced coordinates
+        parameters:
+            positions: np.array[float] | (N, 3) cartesian coordinates
+        """
+        return np.dot(positions, self.get_inverse())
 
     def mag_a(self):
         """
         return: float | magnitude of 'a' vector
         """
-        return np.sqrt(np.dot(self.get_a(), self.get_a()))
+        return np.sqrt(self.get_metric()[0,0])
 
     def mag_b(self):
         """
         return: float | magnitude of 'b' vector
         """
-        return np.sqrt(np.dot(self.get_b(), self.get_b()))
+        return np.sqrt(self.get_metric()[1,1])
 
     def mag_c(self):
         """
         return: float | magnitude of 'c' vector
         """
-        return np.sqrt(np.dot(self.get_c(), self.get_c()))
+        return np.sqrt(self.get_metric()[2,2])
 
-    def alpha(self, unit='degrees'):
+    def _angle(self, i, j, unit):
         """
-        return: float | alpha angle
-        parameters:
-            unit: string | 'degrees' (default) or 'radians'
+        return: float | angle between lattice vectors i and j
         """
-        numerator = np.dot(self.get_b(), self.get_c())
-        denominator = self.mag_b() * self.mag_c()
-        theta = np.arccos(numerator / denominator)
+        metric = self.get_metric()
+        theta = np.arccos(metric[i,j] / np.sqrt(metric[i,i] * metric[j,j]))
         if unit == 'degrees':
             pi = np.arccos(-1)
             return theta * 180./pi
@@ -200,45 +297,41 @@ class Lattice(object):
         else:
             raise ValueError, 'unit must be degrees or radians'
 
-    def beta(self, unit='degrees'):
+    def alpha(self, unit='degrees'):
         """
         return: float | alpha angle
         parameters:
             unit: string | 'degrees' (default) or 'radians'
         """
-        numerator = np.dot(self.get_a(), self.get_c())
-        denominator = self.mag_a() * self.mag_c()
-        theta = np.arccos(numerator / denominator)
-        if unit == 'degrees':
-            pi = np.arccos(-1)
-            return theta * 180./pi
-        elif unit == 'radians':
-            return theta
-        else:
-            raise ValueError, 'unit must be degrees or radians'
+        return self._angle(1, 2, unit)
+
+    def beta(self, unit='degrees'):
+        """
+        return: float | beta angle
+        parameters:
+            unit: string | 'degrees' (default) or 'radians'
+        """
+        return self._angle(0, 2, unit)
 
     def gamma(self, unit='degrees'):
         """
-        return: float | alpha angle
+        return: float | gamma angle
         parameters:
             unit: string | 'degrees' (default) or 'radians'
         """
-        numerator = np.dot(self.get_a(), self.get_b())
-        denominator = self.mag_a() * self.mag_b()
-        theta = np.arccos(numerator / denominator)
-        if unit == 'degrees':
-            pi = np.arccos(-1)
-            return theta * 180./pi
-        elif unit == 'radians':
-            return theta
-        else:
-            raise ValueError, 'unit must be degrees or radians'
+        return self._angle(0, 1, unit)
 
     def volume(self):
         """
         return: float | scalar triple product
         """
-        return np.abs(np.dot(self.get_a(), np.cross(self.get_b(), self.get_c())))
+        return self._cached('volume', lambda: float(np.abs(np.linalg.det(self._matrix))))
+
+    def to_npz(self, file_name='lattice.npz'):
+        """
+        Save Lattice object as npz checkpoint, see file_tools.load_npz
+        """
+        file_tools.save_npz(self, file_name)
 
     def to_pkl(self, file_name='lattice.pkl'):
         """
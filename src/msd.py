@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+msd.py
+Author: Brian Boates
+
+Mean square displacement and diffusion coefficients using the FFT
+algorithm, O(F log F) in the number of frames F
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+from utils import unwrap_positions
+from utils import autocorrelation_fft
+
+def msd_fft(positions):
+    """
+    MSD(m) = S1(m) - 2 S2(m), where S2 is the position autocorrelation
+    and S1 follows from running sums of the squared positions
+
+    return: np.array[float] | (F, N) mean square displacement of each
+                              atom over all time origins, per lag
+    parameters:
+        positions: np.array[float] | (F, N, 3) unwrapped cartesian coordinates
+    """
+    positions = np.asarray(positions, dtype=float)
+    nframes = len(positions)
+    squares = np.sum(positions**2, axis=2)
+    zeros = np.zeros((1,) + squares.shape[1:])
+    head = np.concatenate((zeros, np.cumsum(squares, axis=0)[:-1]))
+    tail = np.concatenate((zeros, np.cumsum(squares[::-1], axis=0)[:-1]))
+    lags = (nframes - np.arange(nframes))[:,np.newaxis]
+    s1 = (2 * np.sum(squares, axis=0) - head - tail) / lags
+    s2 = np.sum(autocorrelation_fft(positions), axis=2)
+    return s1 - 2 * s2
+
+def compute_msd(positions, lattices, chunk_size=None):
+    """
+    Atoms are processed chunk_size at a time, so positions can be a
+    memory-mapped array larger than RAM
+
+    return: np.array[float] | (F,) MSD averaged over the atoms
+    parameters:
+        positions: np.array[float] | (F, N, 3) reduced coordinates
+        lattices: np.array[float] | (F, 3, 3) lattice vectors as rows
+        chunk_size: int | number of atoms per chunk (default: all)
+    """
+    natom = positions.shape[1]
+    chunk_size = chunk_size or max(1, natom)
+    total = np.zeros(len(positions))
+    for start in xrange(0, natom, chunk_size):
+        reduced = unwrap_positions(positions[:,start:start+chunk_size])
+        cartesian = np.einsum('fni,fij->fnj', reduced, lattices)
+        total += np.sum(msd_fft(cartesian), axis=1)
+    return total / max(1, natom)
+
+def fit_diffusion(time, msd, start=0.1, stop=0.5):
+    """
+    Fits MSD = 6 D t + c over a window of the time axis
+
+    return: float | diffusion coefficient D in length^2 / time units
+    parameters:
+        time: np.array[float] | (F,) time of each lag
+        msd: np.array[float] | (F,) mean square displacement
+        start: float | start of fit window, fraction of the longest lag
+        stop: float | end of fit window, fraction of the longest lag
+    """
+    window = (time >= start * time[-1]) & (time <= stop * time[-1])
+    if np.sum(window) < 2:
+        raise ValueError, 'fit window must contain at least two lags'
+    slope = np.polyfit(time[window], msd[window], 1)[0]
+    return slope / 6.0
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+neighbor_list.py
+Author: Brian Boates
+
+Implements NeighborList()
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+from utils import supercell_size
+
+class NeighborList(object):
+    """
+    Verlet neighbor list: pairs within cutoff + skin are found with a
+    cell list, then only those candidate pairs are checked in later
+    configurations until some atom has moved more than skin / 2.
+    """
+    def __init__(self, cutoff, skin=0.3, name1=None, name2=None):
+        """
+        parameters:
+            cutoff: float | cartesian cutoff radius
+            skin: float | extra cartesian radius kept in the list
+            name1: string | atom type
+            name2: string | atom type
+        """
+        self._cutoff = cutoff
+        self._skin = skin
+        self._name1 = name1
+        self._name2 = name2
+        self._candidates = None
+        self._reference = None
+        self._reference_lattice = None
+        self._reference_types = None
+        self._neighbors = None
+        self._num_builds = 0
+        self._num_updates = 0
+
+    def __str__(self):
+        """
+        return: string
+        """
+        values = (self.get_cutoff(), self.get_skin(), self.num_builds(), self.num_updates())
+        s = '<NeighborList: cutoff=%s, skin=%s, num_builds=%s, num_updates=%s>' % values
+        return s
+
+    def __repr__(self):
+        """
+        return: string
+        """
+        return self.__str__()
+
+    def get_cutoff(self):
+        """
+        return: float
+        """
+        return self._cutoff
+
+    def get_skin(self):
+        """
+        return: float
+        """
+        return self._skin
+
+    def num_builds(self):
+        """
+        return: int | number of times the candidate pairs were rebuilt
+        """
+        return self._num_builds
+
+    def num_updates(self):
+        """
+        return: int | number of configurations the list was updated for
+        """
+        return self._num_updates
+
+    def rebuild_rate(self):
+        """
+        return: float | fraction of updates that needed a rebuild
+        """
+        if not self.num_updates():
+            return 0.0
+        return float(self.num_builds()) / self.num_updates()
+
+    def _atom_types(self, configuration):
+        """
+        return: list[tuple(string, int)] | atom types and their counts
+        """
+        return [(name, configuration.get_natom(name))
+                for name in configuration.get_atom_types()]
+
+    def build(self, configuration):
+        """
+        Find all pairs within cutoff + skin
+        parameters:
+            configuration: Configuration
+        """
+        idx1, idx2, distances = configuration.get_neighbors(self.get_cutoff() + self.get_skin()
+                                                           ,self._name1, self._name2)
+        self._candidates = (idx1, idx2)
+        self._reference = configuration.get_positions().copy()
+        self._reference_lattice = configuration.get_lattice().get_matrix()
+        self._reference_types = self._atom_types(configuration)
+        self._num_builds += 1
+
+    def needs_rebuild(self, configuration):
+        """
+        A rebuild is needed when any atom has moved more than skin / 2
+        since the last build. The atoms or lattice changing (e.g. in a
+        variable cell simulation) also trigger a rebuild.
+
+        return: bool
+        parameters:
+            configuration: Configuration
+        """
+        if self._candidates is None:
+            return True
+        if self._atom_types(configuration) != self._reference_types:
+            return True
+        matrix = configuration.get_lattice().get_matrix()
+        if not np.allclose(matrix, self._reference_lattice):
+            return True
+
+        diff = configuration.get_positions() - self._reference
+        diff -= np.round(diff)
+        moved = np.dot(diff, matrix)
+        max_moved = np.sqrt(np.max(np.einsum('ij,ij->i', moved, moved))) if len(moved) else 0.0
+        return max_moved > 0.5 * self.get_skin()
+
+    def update(self, configuration):
+        """
+        Rebuild if needed, then find the candidate pairs within cutoff
+
+        return: tuple(np.array[int], np.array[int], np.array[float])
+                | atom indices (into get_atoms()) of each pair and
+                  their cartesian distance
+        parameters:
+            configuration: Configuration
+        """
+        self._num_updates += 1
+        if np.any(supercell_size(configuration.get_lattice(), self.get_cutoff() + self.get_skin()) > 1):
+            # pairs repeat over periodic images, so they are found directly
+            self._candidates = None
+            self._num_builds += 1
+            self._neighbors = configuration.get_neighbors(self.get_cutoff(), self._name1, self._name2)
+            return self._neighbors
+        if self.needs_rebuild(configuration):
+            self.build(configuration)
+
+        idx1, idx2 = self._candidates
+        positions = configuration.get_positions()
+        diff = positions[idx1] - positions[idx2]
+        diff -= np.round(diff)
+        cartesian = np.dot(diff, configuration.get_lattice().get_matrix())
+        distances = np.sqrt(np.einsum('ij,ij->i', cartesian, cartesian))
+        within = distances <= self.get_cutoff()
+        self._neighbors = (idx1[within], idx2[within], distances[within])
+        return self._neighbors
+
+    def get_neighbors(self):
+        """
+        return: tuple(np.array[int], np.array[int], np.array[float])
+                | pairs found by the last update
+        """
+        return self._neighbors
+
+    def iterate(self, configurations):
+        """
+        Update the list for each configuration in turn
+
+        return: iterator[tuple(Configuration, np.array[int], np.array[int], np.array[float])]
+        parameters:
+            configurations: iterable[Configuration]
+        """
+        for configuration in configurations:
+            idx1, idx2, distances = self.update(configuration)
+            yield configuration, idx1, idx2, distances
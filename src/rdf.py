@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+rdf.py
+Author: Brian Boates
+
+Radial distribution function g(r) accumulated over configurations
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+from utils import map_frames
+
+def _shell_volumes(r_max, nbins):
+    """
+    return: np.array[float] | volume of each spherical shell bin
+    """
+    edges = np.linspace(0.0, r_max, nbins+1)
+    return 4.0/3.0 * np.pi * (edges[1:]**3 - edges[:-1]**3)
+
+def rdf_frames(configurations, r_max, nbins):
+    """
+    Histograms the pairs within r_max of each configuration by atom
+    type pair, normalized by that configuration's volume and counts
+
+    return: tuple(dict[string:np.array[float]], dict[string:int])
+            | summed g(r) of each pair type (e.g. 'C-O') and the
+              number of configurations contributing to it
+    parameters:
+        configurations: iterable[Configuration]
+        r_max: float | cartesian cutoff radius
+        nbins: int | number of histogram bins
+    """
+    shells = _shell_volumes(r_max, nbins)
+    sums, nframes = {}, {}
+    for configuration in configurations:
+
+        names = configuration.get_atom_types()
+        ntypes = len(names)
+        idx1, idx2, distances = configuration.get_neighbors(r_max)
+        species1 = configuration.get_species()[idx1]
+        species2 = configuration.get_species()[idx2]
+        pair = np.minimum(species1, species2) * ntypes + np.maximum(species1, species2)
+        bins = np.minimum((distances * nbins / r_max).astype(int), nbins - 1)
+        counts = np.bincount(pair * nbins + bins, minlength=ntypes * ntypes * nbins)
+        counts = counts.reshape(ntypes, ntypes, nbins)
+
+        volume = configuration.get_lattice().volume()
+        # past half the cell width each atom also pairs with its own
+        # images (see utils.image_pairs), once per +/- image pair
+        self_images = r_max > 0.5 * np.min(configuration.get_lattice().perpendicular_widths())
+        for a in xrange(ntypes):
+            for b in xrange(a, ntypes):
+                natom_a = configuration.get_natom(names[a])
+                natom_b = configuration.get_natom(names[b])
+                if a != b:
+                    npairs = natom_a * natom_b
+                elif self_images:
+                    npairs = natom_a * natom_a / 2.0
+                else:
+                    npairs = natom_a * (natom_a - 1) / 2.0
+                if not npairs:
+                    continue
+                key = min(names[a], names[b]) + '-' + max(names[a], names[b])
+                g = counts[a,b] / (npairs / volume * shells)
+                sums[key] = sums.get(key, 0.0) + g
+                nframes[key] = nframes.get(key, 0) + 1
+
+    return sums, nframes
+
+def compute_rdf(configurations, r_max, nbins=200, nprocs=1):
+    """
+    Memory is bounded by the number of bins: pairs are only held for
+    one configuration at a time, and the configurations are spread over
+    nprocs worker processes whose partial histograms are merged.
+
+    return: tuple(np.array[float], dict[string:np.array[float]])
+            | bin centers and g(r) for each atom type pair (e.g. 'C-O')
+    parameters:
+        configurations: iterable[Configuration]
+        r_max: float | cartesian cutoff radius
+        nbins: int | number of histogram bins
+        nprocs: int | number of worker processes
+    """
+    sums, nframes = {}, {}
+    for partial_sums, partial_nframes in map_frames(rdf_frames, configurations
+                                                   ,(r_max, nbins), nprocs):
+        for key in partial_sums:
+            sums[key] = sums.get(key, 0.0) + partial_sums[key]
+            nframes[key] = nframes.get(key, 0) + partial_nframes[key]
+
+    r = (np.arange(nbins) + 0.5) * r_max / nbins
+    return r, dict((key, sums[key] / nframes[key]) for key in sums)
+
+
+def main():
+
+    # ideal gas of 1, 2 and 4 atoms per type in cells smaller than
+    # 2 * r_max: past a few cell widths g(r) of every pair goes to 1
+    # (the cell edge varies so the self-image shells are smeared out)
+    import file_tools
+    from lattice import Lattice
+    from configuration import Configuration
+    np.random.seed(0)
+    configurations = []
+    for i in xrange(400):
+        edge = np.random.uniform(3.0, 5.0)
+        configuration = Configuration(lattice=Lattice(edge, 0, 0, 0, edge, 0, 0, 0, edge))
+        configuration.insert_positions('O', np.random.rand(1, 3))
+        configuration.insert_positions('H', np.random.rand(2, 3))
+        configuration.insert_positions('C', np.random.rand(4, 3))
+        configurations.append(configuration)
+    r, g = compute_rdf(configurations, 12.0, nbins=24)
+    for key in sorted(g):
+        print '%s  mean g(r > 8) = %.3f' % (key, np.mean(g[key][r > 8.0]))
+
+
+if __name__ == '__main__':
+    main()
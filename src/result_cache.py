@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+"""
+result_cache.py
+Author: Brian Boates
+
+On-disk least-recently-used cache of analysis results, keyed by a
+content fingerprint of the input, the analysis name and its parameters.
+
+The cache is off unless enabled with enable_cache(), or by setting the
+PYMODA_CACHE_DIR environment variable (and optionally PYMODA_CACHE_SIZE
+in bytes) before importing.
+"""
+import sys
+sys.dont_write_bytecode = True
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import instrument
+
+DEFAULT_CACHE_SIZE = 2**30
+
+# file fingerprints, reused while the file's size and mtime are unchanged
+_FILE_FINGERPRINTS = {}
+
+def fingerprint_strings(strings):
+    """
+    return: string | hex digest of a sequence of strings
+    parameters:
+        strings: iterable[string]
+    """
+    digest = hashlib.sha1()
+    for s in strings:
+        digest.update('%d:%s' % (len(s), s))
+    return digest.hexdigest()
+
+def fingerprint_arrays(arrays, block_size=2**24):
+    """
+    Large (e.g. memory-mapped) arrays are hashed a block of rows at a time
+
+    return: string | hex digest of the dtype, shape and contents of arrays
+    parameters:
+        arrays: iterable[np.array]
+        block_size: int | bytes hashed at a time
+    """
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.asanyarray(array)
+        digest.update('%s%s' % (array.dtype.str, array.shape))
+        if array.ndim == 0:
+            digest.update(np.ascontiguousarray(array).data)
+            continue
+        rows = max(1, block_size // max(1, array[:1].nbytes))
+        for start in xrange(0, len(array), rows):
+            digest.update(np.ascontiguousarray(array[start:start+rows]).data)
+    return digest.hexdigest()
+
+@instrument.timed('result_cache.fingerprint_file')
+def fingerprint_file(file_name, block_size=2**22):
+    """
+    Hashes the file once, then reuses the digest while its size and
+    modification time are unchanged
+
+    return: string | hex digest of the file's contents
+    parameters:
+        file_name: string | name of file
+        block_size: int | bytes read at a time
+    """
+    path = os.path.abspath(file_name)
+    stat = os.stat(path)
+    stamp = (stat.st_size, stat.st_mtime)
+    if _FILE_FINGERPRINTS.get(path, (None,))[0] != stamp:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as infile:
+            for block in iter(lambda: infile.read(block_size), ''):
+                digest.update(block)
+        _FILE_FINGERPRINTS[path] = (stamp, digest.hexdigest())
+    return _FILE_FINGERPRINTS[path][1]
+
+def _flatten(result, arrays):
+    """
+    return: list | json structure of result, with arrays replaced by
+                   their index into arrays
+    parameters:
+        result: np.array, scalar, or (nested) dict, tuple or list of them
+        arrays: list[np.array] | appended to
+    """
+    if isinstance(result, dict):
+        return ['dict', [[key, _flatten(result[key], arrays)] for key in sorted(result)]]
+    elif isinstance(result, (tuple, list)):
+        return [type(result).__name__, [_flatten(item, arrays) for item in result]]
+    elif result is None:
+        return ['none', None]
+    arrays.append(np.asarray(result))
+    kind = 'array' if isinstance(result, np.ndarray) else 'scalar'
+    return [kind, len(arrays) - 1]
+
+def _unflatten(structure, arrays):
+    """
+    return: result rebuilt from _flatten's structure and arrays
+    """
+    kind, value = structure
+    if kind == 'dict':
+        return dict((str(key), _unflatten(item, arrays)) for key, item in value)
+    elif kind == 'tuple':
+        return tuple(_unflatten(item, arrays) for item in value)
+    elif kind == 'list':
+        return [_unflatten(item, arrays) for item in value]
+    elif kind == 'none':
+        return None
+    elif kind == 'scalar':
+        return arrays['a%d' % value].item()
+    return arrays['a%d' % value]
+
+
+class ResultCache(object):
+    """
+    Results are stored one npz file per key in cache_dir. Reading an
+    entry marks it as recently used, and once the entries exceed
+    max_bytes the least recently used ones are removed.
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE):
+        """
+        parameters:
+            cache_dir: string | directory for cache entries (created if needed)
+            max_bytes: int | size limit of all entries
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def __str__(self):
+        """
+        return: string
+        """
+        values = (self._cache_dir, self._hits, self._misses)
+        s = '<ResultCache: cache_dir=%s, hits=%s, misses=%s>' % values
+        return s
+
+    def __repr__(self):
+        """
+        return: string
+        """
+        return self.__str__()
+
+    def get_cache_dir(self):
+        """
+        return: string
+        """
+        return self._cache_dir
+
+    def get_max_bytes(self):
+        """
+        return: int
+        """
+        return self._max_bytes
+
+    def get_stats(self):
+        """
+        return: dict[string:int] | hits, misses and evictions since this
+                                   cache was created, and current entries
+                                   and bytes on disk
+        """
+        entries = self._entries()
+        return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions
+               ,'entries': len(entries), 'bytes': sum(size for path, size, mtime in entries)}
+
+    def make_key(self, analysis, fingerprint, params):
+        """
+        return: string | cache key
+        parameters:
+            analysis: string | name of the analysis
+            fingerprint: string | content fingerprint of the input
+            params: dict | parameters that change the result
+        """
+        return fingerprint_strings([analysis, fingerprint, json.dumps(params, sort_keys=True
+                                                                  ,default=repr)])
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key + '.npz')
+
+    def _entries(self):
+        """
+        return: list[tuple(string, int, float)] | path, size and mtime of entries
+        """
+        entries = []
+        for file_name in os.listdir(self._cache_dir):
+            if not file_name.endswith('.npz'):
+                continue
+            path = os.path.join(self._cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def contains(self, key):
+        """
+        return: bool
+        parameters:
+            key: string | from make_key
+        """
+        return os.path.exists(self._path(key))
+
+    def get(self, key, default=None):
+        """
+        return: cached result, or default on a miss
+        parameters:
+            key: string | from make_key
+            default: returned on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as infile:
+                npz = np.load(infile)
+                result = _unflatten(json.loads(str(npz['structure'])), npz)
+        except (IOError, OSError, ValueError, KeyError):
+            self._misses += 1
+            return default
+        os.utime(path, None)
+        self._hits += 1
+        return result
+
+    def put(self, key, result):
+        """
+        parameters:
+            key: string | from make_key
+            result: np.array, scalar, or (nested) dict, tuple or list of them
+        """
+        arrays = []
+        structure = json.dumps(_flatten(result, arrays))
+        named = dict(('a%d' % idx, array) for idx, array in enumerate(arrays))
+        # written to a temporary file first so readers never see a partial entry
+        handle, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as outfile:
+            np.savez(outfile, structure=np.array(structure), **named)
+        os.rename(tmp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until under max_bytes
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for path, size, mtime in entries)
+        for path, size, mtime in entries:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        for path, size, mtime in self._entries():
+            os.remove(path)
+
+
+_cache = None
+
+def enable_cache(cache_dir=None, max_bytes=DEFAULT_CACHE_SIZE):
+    """
+    return: ResultCache | now used by all cached analyses
+    parameters:
+        cache_dir: string | directory for entries (default: ~/.cache/pymoda)
+        max_bytes: int | size limit of all entries
+    """
+    global _cache
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'pymoda')
+    _cache = ResultCache(cache_dir, max_bytes)
+    return _cache
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+def get_cache():
+    """
+    return: ResultCache | None if caching is disabled
+    """
+    return _cache
+
+def cached(analysis, source, params, compute):
+    """
+    Returns the cached result if there is one, otherwise computes and
+    stores it. With caching disabled this only calls compute(), and the
+    input is not fingerprinted.
+
+    return: result of compute()
+    parameters:
+        analysis: string | name of the analysis
+        source: object with get_fingerprint() | input of the analysis
+        params: dict | parameters that change the result
+        compute: callable | computes the result
+    """
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    key = cache.make_key(analysis, source.get_fingerprint(), params)
+    missing = object()
+    result = cache.get(key, missing)
+    if result is missing:
+        instrument.count('result_cache.misses')
+        result = compute()
+        cache.put(key, result)
+    else:
+        instrument.count('result_cache.hits')
+    return result
+
+if os.environ.get('PYMODA_CACHE_DIR'):
+    enable_cache(os.environ['PYMODA_CACHE_DIR']
+                ,int(os.environ.get('PYMODA_CACHE_SIZE', DEFAULT_CACHE_SIZE)))
@@ -9,6 +9,21 @@ import sys
 sys.dont_write_bytecode = True
 import numpy as np
 import file_tools
+import instrument
+from rdf import compute_rdf
+from structure_factor import compute_structure_factor
+from clusters import compute_cluster_sizes
+from bond_angles import compute_bond_angles
+from utils import unwrap_configurations
+from msd import compute_msd
+from msd import fit_diffusion
+from vacf import velocities_from_positions
+from vacf import compute_vacf
+from vacf import vdos
+from utils import atomic_mass
+from utils import AMU_PER_A3_TO_G_PER_CM3
+from result_cache import cached
+from result_cache import fingerprint_strings
 from atom import Atom
 from lattice import Lattice
 from configuration import Configuration
@@ -16,14 +31,17 @@ from configuration import Configuration
 class Simulation(object):
     """
     """
-    def __init__(self, configurations=[], timestep=None):
+    def __init__(self, configurations=[], timestep=None, frames=None):
         """
         parameters:
             configurations: list[Configuration]
             timestep: float
+            frames: sequence[Configuration] | indexable frames (e.g.
+                    TrjFrames) used as is, so they can be loaded lazily
         """
-        self._configurations = []
+        self._configurations = [] if frames is None else frames
         self._timestep = timestep
+        self._velocities = None
         self.insert_configurations(configurations)
 
     def __str__(self):
@@ -46,18 +64,17 @@ class Simulation(object):
         """
         return iter(self.get_configurations())
 
-    def trj_str(self):
+    def trj_str(self, precision=10):
         """
         return: string | for trj file
+        parameters:
+            precision: int | number of decimals for reduced coordinates
         """
-        s = ''
-        for configuration in self:
-            s += configuration.trj_str()
-        return s
+        return ''.join(configuration.trj_str(precision) for configuration in self)
 
     def get_configurations(self):
         """
-        return: list[Configuration]
+        return: sequence[Configuration] | list unless lazily loaded
         """
         return self._configurations
 
@@ -93,6 +110,9 @@ class Simulation(object):
         parameters:
             configuration: Configuration
         """
+        if not isinstance(self._configurations, list):
+            # lazily loaded frames are read in before inserting
+            self._configurations = list(self._configurations)
         self._configurations.append(configuration)
 
     def insert_configurations(self, configurations):
@@ -120,25 +140,324 @@ class Simulation(object):
         else:
             raise IndexError, 'timestep_idx out of simulation range'
 
+    def get_slice(self, start=None, stop=None, step=None):
+        """
+        Lazily loaded frames stay lazy in the slice
+
+        return: Simulation | configurations[start:stop:step]
+        parameters:
+            start: int | first configuration index
+            stop: int | configuration index to stop at
+            step: int | take every step-th configuration
+        """
+        timestep = self.get_timestep()
+        if timestep is not None and step:
+            timestep *= step
+        frames = self.get_configurations()[start:stop:step]
+        return Simulation(frames=frames, timestep=timestep)
+
+    def get_positions(self, name=None):
+        """
+        Memory-mapped for simulations opened from binary trajectory files,
+        otherwise stacked from the configurations
+
+        return: np.array[float] | (num_configurations, natom, 3) reduced coordinates
+        parameters:
+            name: string | type of atoms to get
+        """
+        frames = self.get_configurations()
+        if hasattr(frames, 'get_positions'):
+            return frames.get_positions(name)
+        return np.array([configuration.get_positions(name) for configuration in frames])
+
+    def get_lattices(self):
+        """
+        return: np.array[float] | (num_configurations, 3, 3) lattice vectors as rows
+        """
+        frames = self.get_configurations()
+        if hasattr(frames, 'get_lattices'):
+            return frames.get_lattices()
+        return np.array([configuration.get_lattice().get_matrix()
+                         for configuration in frames])
+
+    @instrument.timed('simulation.get_fingerprint')
+    def get_fingerprint(self):
+        """
+        Lazily loaded frames are fingerprinted from their file, other
+        configurations from their contents
+
+        return: string | digest of the configurations and timestep, the
+                         input key for cached analyses
+        """
+        frames = self.get_configurations()
+        if hasattr(frames, 'get_fingerprint'):
+            fingerprints = [frames.get_fingerprint()]
+        else:
+            fingerprints = [configuration.get_fingerprint() for configuration in frames]
+        return fingerprint_strings([repr(self.get_timestep())] + fingerprints)
+
+    @instrument.timed('simulation.get_centers_of_mass')
+    def get_centers_of_mass(self):
+        """
+        return: np.array[float] | (num_configurations, 3) cartesian center
+                                  of mass of each configuration
+        """
+        return np.array([configuration.get_center_of_mass()
+                         for configuration in self.get_configurations()])
+
+    def get_densities(self):
+        """
+        Assumes the same atoms in every configuration, so only the
+        lattices are read after the first configuration
+
+        return: np.array[float] | (num_configurations,) mass density in g/cm^3
+        """
+        total_mass = self.get_configuration(0).get_total_mass()
+        volumes = np.abs(np.linalg.det(self.get_lattices()))
+        return total_mass / volumes * AMU_PER_A3_TO_G_PER_CM3
+
+    def iter_neighbors(self, neighbor_list):
+        """
+        Reuses neighbor_list across configurations, only rebuilding it
+        when atoms have moved more than half its skin.
+
+        return: iterator[tuple(Configuration, np.array[int], np.array[int], np.array[float])]
+                | each configuration with its neighbor pair indices and distances
+        parameters:
+            neighbor_list: NeighborList
+        """
+        return neighbor_list.iterate(self)
+
+    @instrument.timed('simulation.get_rdf')
+    def get_rdf(self, r_max, nbins=200, nprocs=1):
+        """
+        return: tuple(np.array[float], dict[string:np.array[float]])
+                | bin centers and g(r) for each atom type pair (e.g. 'C-O'),
+                  averaged over all configurations
+        parameters:
+            r_max: float | cartesian cutoff radius
+            nbins: int | number of histogram bins
+            nprocs: int | number of worker processes
+        """
+        return cached('rdf', self, {'r_max': r_max, 'nbins': nbins}
+                     ,lambda: compute_rdf(self, r_max, nbins, nprocs))
+
+    @instrument.timed('simulation.get_msd')
+    def get_msd(self, name=None, chunk_size=None):
+        """
+        Mean square displacement over all time origins, computed from
+        unwrapped positions with the FFT algorithm. Atoms are processed
+        chunk_size at a time; for simulations opened from binary files
+        only those atoms' positions are read.
+
+        return: tuple(np.array[float], dict[string:np.array[float]])
+                | time of each lag (in frames if no timestep is set) and
+                  the MSD of each atom type
+        parameters:
+            name: string | atom type (default: all types)
+            chunk_size: int | number of atoms per chunk (default: all)
+        """
+        def compute():
+            positions = self.get_positions()
+            lattices = self.get_lattices()
+            configuration = self.get_configuration(0)
+            names = [name] if name else configuration.get_atom_types()
+            msd = {}
+            for atom_type in names:
+                start, stop = configuration.get_species_range(atom_type)
+                msd[atom_type] = compute_msd(positions[:,start:stop], lattices, chunk_size)
+
+            frames = np.arange(self.num_configurations())
+            time = frames * self.get_timestep() if self.get_timestep() else frames
+            return time, msd
+
+        return cached('msd', self, {'name': name}, compute)
+
+    @instrument.timed('simulation.get_diffusion_coefficients')
+    def get_diffusion_coefficients(self, start=0.1, stop=0.5, chunk_size=None):
+        """
+        return: dict[string:float] | diffusion coefficient of each atom type
+                                     from a linear fit of its MSD
+        parameters:
+            start: float | start of fit window, fraction of the longest lag
+            stop: float | end of fit window, fraction of the longest lag
+            chunk_size: int | number of atoms per chunk (default: all)
+        """
+        time, msd = self.get_msd(chunk_size=chunk_size)
+        return dict((name, fit_diffusion(time, msd[name], start, stop)) for name in msd)
+
+    @instrument.timed('simulation.get_structure_factor')
+    def get_structure_factor(self, k_max, nbins=100, memory_limit=2**27, partial=False
+                            ,nprocs=1):
+        """
+        return: tuple(np.array[float], dict[string:np.array[float]])
+                | shell centers q and S(q) averaged over all configurations,
+                  for 'total' and, if partial, each atom type pair
+        parameters:
+            k_max: float | largest |k| in inverse length units
+            nbins: int | number of |k| shells
+            memory_limit: int | bytes of scratch space per block of k-vectors
+            partial: bool | also compute partial structure factors
+            nprocs: int | number of worker processes
+        """
+        return cached('structure_factor', self, {'k_max': k_max, 'nbins': nbins, 'partial': partial}
+                     ,lambda: compute_structure_factor(self, k_max, nbins, memory_limit
+                                                      ,partial, nprocs))
+
+    @instrument.timed('simulation.get_cluster_sizes')
+    def get_cluster_sizes(self, cutoffs, nprocs=1):
+        """
+        Cluster size distribution over all configurations, from the
+        connected components of each configuration's bond graph
+
+        return: tuple(np.array[int], np.array[int]) | cluster sizes and how
+                                                      many clusters of each
+                                                      size were found
+        parameters:
+            cutoffs: float or dict[string:float] | one cutoff for all pairs,
+                                                   or one per pair (e.g. 'C-O')
+            nprocs: int | number of worker processes
+        """
+        return cached('cluster_sizes', self, {'cutoffs': cutoffs}
+                     ,lambda: compute_cluster_sizes(self, cutoffs, nprocs))
+
+    @instrument.timed('simulation.get_bond_angles')
+    def get_bond_angles(self, cutoffs, nbins=180, nprocs=1):
+        """
+        Distribution of neighbor-center-neighbor angles over all
+        configurations, for bonds within cutoffs
+
+        return: tuple(np.array[float], dict[string:np.array[float]])
+                | bin centers in degrees and the normalized angle distribution
+                  of each triplet (e.g. 'H-O-H', center in the middle)
+        parameters:
+            cutoffs: float or dict[string:float] | one cutoff for all pairs,
+                                                   or one per pair (e.g. 'C-O')
+            nbins: int | number of histogram bins
+            nprocs: int | number of worker processes
+        """
+        return cached('bond_angles', self, {'cutoffs': cutoffs, 'nbins': nbins}
+                     ,lambda: compute_bond_angles(self, cutoffs, nbins, nprocs))
+
+    def iter_unwrapped(self):
+        """
+        Streams unwrapped configurations, e.g. for lazily loaded simulations
+
+        return: iterator[Configuration]
+        """
+        return unwrap_configurations(self)
+
+    @instrument.timed('simulation.unwrap_coordinates')
     def unwrap_coordinates(self):
         """
+        Destructive: atom positions will be changed
+
+        Lazily loaded configurations are re-read from file when accessed,
+        so use iter_unwrapped() for those instead
+        """
+        for configuration in self.iter_unwrapped():
+            pass
+
+    def _require_timestep(self):
+        """
+        return: float | simulation timestep
         """
-        pass
+        if not self.get_timestep():
+            raise ValueError, 'timestep required for velocities'
+        return self.get_timestep()
 
+    @instrument.timed('simulation.set_velocities')
     def set_velocities(self):
         """
-        Warning: only valid if simulation is unwrapped
+        Computes velocities of all atoms in all configurations at once by
+        finite differences of the unwrapped cartesian positions
+        """
+        self._velocities = velocities_from_positions(self.get_positions()
+                                                    ,self.get_lattices()
+                                                    ,self._require_timestep())
+
+    def get_velocities(self):
+        """
+        return: np.array[float] | (num_configurations, natom, 3) cartesian
+                                  velocities, None until set_velocities()
+        """
+        return self._velocities
+
+    @instrument.timed('simulation.get_vacf')
+    def get_vacf(self, name=None, chunk_size=None):
+        """
+        Velocity autocorrelation function over all time origins. Velocities
+        are computed chunk_size atoms at a time rather than stored.
+
+        return: tuple(np.array[float], dict[string:np.array[float]])
+                | time of each lag and the VACF of each atom type,
+                  averaged over its atoms
+        parameters:
+            name: string | atom type (default: all types)
+            chunk_size: int | number of atoms per chunk (default: all)
+        """
+        dt = self._require_timestep()
+
+        def compute():
+            positions = self.get_positions()
+            lattices = self.get_lattices()
+            configuration = self.get_configuration(0)
+            names = [name] if name else configuration.get_atom_types()
+            vacf = {}
+            for atom_type in names:
+                start, stop = configuration.get_species_range(atom_type)
+                total = compute_vacf(positions[:,start:stop], lattices, dt, chunk_size)
+                vacf[atom_type] = total / max(1, stop - start)
+            return np.arange(len(positions)) * dt, vacf
+
+        return cached('vacf', self, {'name': name}, compute)
+
+    @instrument.timed('simulation.get_vdos')
+    def get_vdos(self, chunk_size=None):
         """
-        pass
+        Mass-weighted vibrational density of states. The partial density
+        of states of each atom type sums to the total, which integrates
+        to 1 over positive frequencies.
+
+        return: tuple(np.array[float], dict[string:np.array[float]])
+                | frequencies (1 / time units) and the partial density of
+                  states of each atom type
+        parameters:
+            chunk_size: int | number of atoms per chunk (default: all)
+        """
+        dt = self._require_timestep()
+        time, vacf = self.get_vacf(chunk_size=chunk_size)
+        configuration = self.get_configuration(0)
+        weighted = dict((name, atomic_mass(name) * configuration.get_natom(name) * vacf[name])
+                        for name in vacf)
+        norm = sum(weighted[name][0] for name in weighted)
+        dos = {}
+        for name in weighted:
+            frequencies, dos[name] = vdos(weighted[name] / norm, dt)
+        return frequencies, dos
 
-    def to_trj(self, file_name='simulation.trj'):
+    def to_trj(self, file_name='simulation.trj', precision=10):
         """
-        Write Simulation object to trj file
+        Write Simulation object to trj file, one configuration at a time
         parameters:
             file_name: string | name for output trj file
+            precision: int | number of decimals for reduced coordinates
+        """
+        file_tools.write_trj(self, file_name, precision)
+
+    def to_bin(self, file_name='simulation.bin'):
+        """
+        Write Simulation object to binary trajectory file
+        parameters:
+            file_name: string | name for output binary file
+        """
+        file_tools.write_bin(self, file_name)
+
+    def to_npz(self, file_name='simulation.npz'):
+        """
+        Save Simulation object as npz checkpoint, see file_tools.load_npz
         """
-        with open(file_name, 'w') as outfile:
-            outfile.write(self.trj_str().strip())
+        file_tools.save_npz(self, file_name)
 
     def to_pkl(self, file_name='simulation.pkl'):
         """
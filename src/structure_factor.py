@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+structure_factor.py
+Author: Brian Boates
+
+Static structure factor S(q) from the density Fourier components of
+the reciprocal lattice vectors allowed by each configuration's lattice
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+from utils import map_frames
+
+def iter_kvectors(lattice, k_max, block_size):
+    """
+    Reciprocal lattice vectors with 0 < |k| <= k_max, one of each +/-k
+    pair since S(k) = S(-k), generated one plane of h at a time
+
+    return: iterator[tuple(np.array[float], np.array[float])]
+            | blocks of at most block_size (B, 3) k-vectors and their (B,) norms
+    parameters:
+        lattice: Lattice
+        k_max: float | largest |k| in inverse length units
+        block_size: int | number of k-vectors per block
+    """
+    reciprocal = lattice.get_reciprocal()
+    lengths = np.sqrt(np.diag(lattice.get_metric()))
+    h_max, k_max_idx, l_max = (k_max * lengths / (2*np.pi)).astype(int)
+    k_idx, l_idx = np.meshgrid(np.arange(-k_max_idx, k_max_idx+1), np.arange(-l_max, l_max+1)
+                              ,indexing='ij')
+    k_idx, l_idx = k_idx.ravel(), l_idx.ravel()
+
+    for h in xrange(h_max+1):
+        hkl = np.column_stack((np.repeat(h, len(k_idx)), k_idx, l_idx))
+        if h == 0:
+            hkl = hkl[(k_idx > 0) | ((k_idx == 0) & (l_idx > 0))]
+        kvectors = np.dot(hkl, reciprocal)
+        norms = np.sqrt(np.sum(kvectors**2, axis=1))
+        within = (norms > 0) & (norms <= k_max)
+        kvectors, norms = kvectors[within], norms[within]
+        for start in xrange(0, len(kvectors), block_size):
+            yield kvectors[start:start+block_size], norms[start:start+block_size]
+
+def structure_factor_frames(configurations, k_max, nbins, memory_limit, partial):
+    """
+    For each block of k-vectors, the phases of all atoms are one matrix
+    product and the Fourier components of each atom type another, with
+    the block size chosen so these arrays fit in memory_limit bytes.
+
+    return: tuple(dict[string:np.array[float]], dict[string:np.array[int]])
+            | summed S(k) and number of k-vectors in each |k| shell, for
+              'total' and, if partial, each atom type pair (e.g. 'C-O')
+    parameters:
+        configurations: iterable[Configuration]
+        k_max: float | largest |k| in inverse length units
+        nbins: int | number of |k| shells
+        memory_limit: int | bytes of scratch space per block
+        partial: bool | also compute partial structure factors
+    """
+    sums, counts = {}, {}
+    for configuration in configurations:
+
+        lattice = configuration.get_lattice()
+        cartesian = configuration.get_cartesian_positions()
+        names = configuration.get_atom_types()
+        natom = configuration.get_natom()
+        indicator = (configuration.get_species() == np.arange(len(names))[:,np.newaxis])
+        indicator = indicator.astype(float)
+
+        pairs = [('total', None, None)]
+        if partial:
+            pairs += [(min(names[a], names[b]) + '-' + max(names[a], names[b]), a, b)
+                      for a in xrange(len(names)) for b in xrange(a, len(names))]
+        for key, a, b in pairs:
+            sums.setdefault(key, np.zeros(nbins))
+            counts.setdefault(key, np.zeros(nbins, dtype=int))
+
+        # phases, cosines and sines: three (natom, block_size) arrays
+        block_size = max(1, memory_limit // (3 * 8 * max(1, natom)))
+        for kvectors, norms in iter_kvectors(lattice, k_max, block_size):
+
+            phases = np.dot(cartesian, kvectors.T)
+            rho_re = np.dot(indicator, np.cos(phases))
+            rho_im = np.dot(indicator, np.sin(phases))
+            bins = np.minimum((norms * nbins / k_max).astype(int), nbins - 1)
+            shell_counts = np.bincount(bins, minlength=nbins)
+
+            for key, a, b in pairs:
+                if a is None:
+                    total_re, total_im = np.sum(rho_re, axis=0), np.sum(rho_im, axis=0)
+                    s = (total_re**2 + total_im**2) / natom
+                else:
+                    normalization = np.sqrt(configuration.get_natom(names[a])
+                                            * configuration.get_natom(names[b]))
+                    s = (rho_re[a] * rho_re[b] + rho_im[a] * rho_im[b]) / normalization
+                sums[key] += np.bincount(bins, weights=s, minlength=nbins)
+                counts[key] += shell_counts
+
+    return sums, counts
+
+def compute_structure_factor(configurations, k_max, nbins=100, memory_limit=2**27
+                            ,partial=False, nprocs=1):
+    """
+    Averages S(k) over the k-vectors in each |k| shell and over all
+    configurations
+
+    return: tuple(np.array[float], dict[string:np.array[float]])
+            | shell centers q and S(q) for 'total' and, if partial, each
+              atom type pair; shells without k-vectors are nan
+    parameters:
+        configurations: iterable[Configuration]
+        k_max: float | largest |k| in inverse length units
+        nbins: int | number of |k| shells
+        memory_limit: int | bytes of scratch space per block of k-vectors
+        partial: bool | also compute partial structure factors
+        nprocs: int | number of worker processes
+    """
+    sums, counts = {}, {}
+    for partial_sums, partial_counts in map_frames(structure_factor_frames, configurations
+                                                  ,(k_max, nbins, memory_limit, partial)
+                                                  ,nprocs):
+        for key in partial_sums:
+            sums[key] = sums.get(key, 0.0) + partial_sums[key]
+            counts[key] = counts.get(key, 0) + partial_counts[key]
+
+    q = (np.arange(nbins) + 0.5) * k_max / nbins
+    with np.errstate(invalid='ignore'):
+        return q, dict((key, sums[key] / counts[key]) for key in sums)
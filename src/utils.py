@@ -5,93 +5,155 @@ Author: Brian Boates
 
 Utility functions for PyMoDA
 """
+import itertools
+import multiprocessing
 import numpy as np
+import instrument
+
+# species table in order of atomic number, built once at import
+SPECIES = ['H', 'He', 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne'
+          ,'Na', 'Mg', 'Al', 'Si', 'P', 'S', 'Cl', 'Ar', 'K', 'Ca'
+          ,'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn'
+          ,'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr', 'Y', 'Zr'
+          ,'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn'
+          ,'Sb', 'Te', 'I', 'Xe', 'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd'
+          ,'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er', 'Tm', 'Yb'
+          ,'Lu', 'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg'
+          ,'Tl', 'Pb', 'Bi', 'Po', 'At', 'Rn', 'Fr', 'Ra']
+
+# atomic masses in amu, aligned with SPECIES
+ATOMIC_MASSES = np.array([1.00794, 4.002602, 6.941, 9.012182, 10.811
+                         ,12.0107, 14.0067, 15.9994, 18.9984032, 20.1797
+                         ,22.98976928, 24.3050, 26.9815386, 28.0855, 30.973762
+                         ,32.065, 35.453, 39.948, 39.0983, 40.078
+                         ,44.955912, 47.867, 50.9415, 51.9961, 54.938045
+                         ,55.845, 58.933195, 58.6934, 63.546, 65.38
+                         ,69.723, 72.64, 74.92160, 78.96, 79.904
+                         ,83.798, 85.4678, 87.62, 88.90585, 91.224
+                         ,92.90638, 95.96, 98.0, 101.07, 102.90550
+                         ,106.42, 107.8682, 112.411, 114.818, 118.710
+                         ,121.760, 127.60, 126.90447, 131.293, 132.9054519
+                         ,137.327, 138.90547, 140.116, 140.90765, 144.242
+                         ,145.0, 150.36, 151.964, 157.25, 158.92535
+                         ,162.500, 164.93032, 167.259, 168.93421, 173.054
+                         ,174.9668, 178.49, 180.94788, 183.84, 186.207
+                         ,190.23, 192.217, 195.084, 196.966569, 200.59
+                         ,204.3833, 207.2, 208.98040, 210.0, 210.0
+                         ,222.0, 223.0, 226.0])
+ATOMIC_MASSES.flags.writeable = False
+
+_SPECIES_INDEX = dict((name, idx) for idx, name in enumerate(SPECIES))
+
+# g/cm^3 per amu/Angstrom^3
+AMU_PER_A3_TO_G_PER_CM3 = 1.66053906660
+
+def species_index(names):
+    """
+    return: np.array[int] | index of each atom type into SPECIES
+    parameters:
+        names: list[string] | atom types (i.e. H, He, Li, ...)
+    """
+    return np.array([_SPECIES_INDEX[name] for name in names], dtype=int)
 
 def atomic_mass(atom_name):
     """
     return: float | atomic mass in amu
     """
-    masses = {'H':1.00794, 'He':4.002602, 'Li':6.941, 'Be':9.012182
-             ,'B':10.811, 'C':12.0107, 'N':14.0067, 'O':15.9994
-             ,'F':18.9984032, 'Ne':20.1797, 'Na':22.98976928, 'Mg':24.3050
-             ,'Al':26.9815386, 'Si':28.0855, 'P':30.973762, 'S':32.065
-             ,'Cl':35.453, 'Ar':39.948, 'K':39.0983, 'Ca':40.078
-             ,'Sc':44.955912, 'Ti':47.867, 'V':50.9415, 'Cr':51.9961
-             ,'Mn':54.938045, 'Fe':55.845, 'Co':58.933195, 'Ni':58.6934
-             ,'Cu':63.546, 'Zn':65.38, 'Ga':69.723, 'Ge':72.64
-             ,'As':74.92160, 'Se':78.96, 'Br':79.904, 'Kr':83.798
-             ,'Rb':85.4678, 'Sr':87.62, 'Y':88.90585, 'Zr':91.224
-             ,'Nb':92.90638, 'Mo':95.96, 'Tc':98.0, 'Ru':101.07
-             ,'Rh':102.90550, 'Pd':106.42, 'Ag':107.8682, 'Cd':112.411
-             ,'In':114.818, 'Sn':118.710, 'Sb':121.760, 'Te':127.60
-             ,'I':126.90447, 'Xe':131.293, 'Cs':132.9054519, 'Ba':137.327
-             ,'La':6.145, 'Ce':6.77, 'Pr':6.773, 'Nd':7.007
-             ,'Pm':7.26, 'Sm':7.52, 'Eu':5.243, 'Gd':7.895
-             ,'Tb':8.229, 'Dy':8.55, 'Ho':8.795, 'Er':9.066
-             ,'Tm':9.321, 'Yb':6.965, 'Lu':174.9668, 'Hf':178.49
-             ,'Ta':180.94788, 'W':183.84, 'Re':186.207, 'Os':190.23
-             ,'Ir':192.217, 'Pt':195.084, 'Au':196.966569, 'Hg':200.59
-             ,'Tl':204.3833, 'Pb':207.2, 'Bi':208.98040, 'Po':210.0
-             ,'At':210.0, 'Rn':222.0, 'Fr':223.0, 'Ra':226.0}
-    return masses[atom_name]
+    return float(ATOMIC_MASSES[_SPECIES_INDEX[atom_name]])
 
-def pbc_displacement(atom1, atom2, unit='reduced', lattice=None):
+def atomic_masses(names):
     """
-    return: np.array | displacement vector in minimum image convention
+    return: np.array[float] | atomic mass in amu of each atom type
     parameters:
-        atom1: Atom
-        atom2: Atom
+        names: list[string] | atom types (i.e. H, He, Li, ...)
+    """
+    return ATOMIC_MASSES[species_index(names)]
+
+# bytes of scratch space used per block of pbc_displacements
+_PBC_BLOCK_BYTES = 2**26
+
+# the 27 image offsets (-1, 0, 1) searched for skewed lattices
+_IMAGE_OFFSETS = np.array([[i, j, k] for i in (-1, 0, 1)
+                                     for j in (-1, 0, 1)
+                                     for k in (-1, 0, 1)], dtype=float)
+
+def pbc_displacements(positions1, positions2, unit='reduced', lattice=None):
+    """
+    Minimum image displacement vectors between every atom in positions1
+    and every atom in positions2 (positions1[i] - positions2[j]).
+
+    In reduced units each component is shifted into [-0.5, 0.5]. In
+    cartesian units the 26 neighbouring images are also checked for
+    skewed lattices, where per-axis rounding is not always the nearest.
+
+    return: np.array[float] | (N, M, 3) displacement vectors
+    parameters:
+        positions1: np.array[float] | (N, 3) reduced coordinates
+        positions2: np.array[float] | (M, 3) reduced coordinates
         unit: string | 'reduced' (default) or 'cartesian'
         lattice: Lattice
     """
-    # make sure coordinates are wrapped
-    a1 = atom1.get_a() - np.floor(atom1.get_a())
-    a2 = atom2.get_a() - np.floor(atom2.get_a())
-    a_diff = a1 - a2
-    if a_diff > 0.5:
-        a_diff += -1
-    elif a_diff < -0.5:
-        a_diff += 1
-
-    b1 = atom1.get_b() - np.floor(atom1.get_b())
-    b2 = atom2.get_b() - np.floor(atom2.get_b())
-    b_diff = b1 - b2
-    if b_diff > 0.5:
-        b_diff += -1
-    elif b_diff < -0.5:
-        b_diff += 1
-
-    c1 = atom1.get_c() - np.floor(atom1.get_c())
-    c2 = atom2.get_c() - np.floor(atom2.get_c())
-    c_diff = c1 - c2
-    if c_diff > 0.5:
-        c_diff += -1
-    elif c_diff < -0.5:
-        c_diff += 1
+    positions1 = np.asarray(positions1, dtype=float).reshape(-1, 3)
+    positions2 = np.asarray(positions2, dtype=float).reshape(-1, 3)
+    if unit not in ('reduced', 'cartesian'):
+        raise ValueError, 'unit must be reduced or cartesian'
+    if unit == 'cartesian' and not lattice:
+        raise ValueError, 'lattice required for cartesian displacement'
 
+    diff = positions1[:,np.newaxis,:] - positions2[np.newaxis,:,:]
+    diff -= np.round(diff)
     if unit == 'reduced':
-        return np.array([a_diff, b_diff, c_diff])
+        return diff
 
-    elif unit == 'cartesian':
-        if not lattice:
-            raise ValueError, 'lattice required for cartesian displacement'
+    matrix = lattice.get_matrix()
+    if lattice.is_orthogonal():
+        return np.dot(diff, matrix)
 
-        x_diff  = a_diff * lattice.get_ax()
-        x_diff += b_diff * lattice.get_bx()
-        x_diff += c_diff * lattice.get_cx()
+    # search neighbouring images in blocks of rows to bound memory
+    displacements = np.empty_like(diff)
+    block_bytes = max(1, diff.shape[1]) * len(_IMAGE_OFFSETS) * 3 * 8
+    block = max(1, _PBC_BLOCK_BYTES // block_bytes)
+    for start in xrange(0, len(diff), block):
+        images = diff[start:start+block,:,np.newaxis,:] + _IMAGE_OFFSETS
+        images = np.dot(images, matrix)
+        nearest = np.argmin(np.einsum('...i,...i', images, images), axis=-1)
+        rows, cols = np.indices(nearest.shape)
+        displacements[start:start+block] = images[rows, cols, nearest]
+    return displacements
 
-        y_diff  = a_diff * lattice.get_ay()
-        y_diff += b_diff * lattice.get_by()
-        y_diff += c_diff * lattice.get_cy()
-
-        z_diff  = a_diff * lattice.get_az()
-        z_diff += b_diff * lattice.get_bz()
-        z_diff += c_diff * lattice.get_cz()
+def pbc_distances(positions1, positions2, unit='reduced', lattice=None):
+    """
+    return: np.array[float] | (N, M) distances in minimum image convention
+    parameters:
+        positions1: np.array[float] | (N, 3) reduced coordinates
+        positions2: np.array[float] | (M, 3) reduced coordinates
+        unit: string | 'reduced' (default) or 'cartesian'
+        lattice: Lattice
+    """
+    positions1 = np.asarray(positions1, dtype=float).reshape(-1, 3)
+    positions2 = np.asarray(positions2, dtype=float).reshape(-1, 3)
 
-        return np.array([x_diff, y_diff, z_diff])
+    # only one block of displacement vectors is held at a time
+    distances = np.empty((len(positions1), len(positions2)))
+    block = max(1, _PBC_BLOCK_BYTES // (max(1, len(positions2)) * 3 * 8))
+    for start in xrange(0, len(positions1), block):
+        displacements = pbc_displacements(positions1[start:start+block], positions2
+                                         ,unit, lattice)
+        distances[start:start+block] = np.sqrt(np.einsum('...i,...i', displacements
+                                                        ,displacements))
+    return distances
 
-    else:
-        raise ValueError, 'unit must be reduced or cartesian'
+def pbc_displacement(atom1, atom2, unit='reduced', lattice=None):
+    """
+    return: np.array | displacement vector in minimum image convention
+    parameters:
+        atom1: Atom
+        atom2: Atom
+        unit: string | 'reduced' (default) or 'cartesian'
+        lattice: Lattice
+    """
+    return pbc_displacements(atom1.get_position(), atom2.get_position()
+                            ,unit, lattice)[0,0]
 
 def pbc_distance(atom1, atom2, unit='reduced', lattice=None):
     """
@@ -105,3 +167,267 @@ def pbc_distance(atom1, atom2, unit='reduced', lattice=None):
     displacement = pbc_displacement(atom1, atom2, unit, lattice)
     return np.sqrt(np.dot(displacement, displacement))
 
+def _cell_offsets(ncells):
+    """
+    return: np.array[int] | (K, 3) distinct neighbouring cell offsets
+    parameters:
+        ncells: np.array[int] | number of cells along each lattice vector
+    """
+    axes = []
+    for n in ncells:
+        # with fewer than 3 cells -1 and +1 refer to the same neighbour
+        axes.append([0] if n == 1 else [0, 1] if n == 2 else [-1, 0, 1])
+    return np.array([[i, j, k] for i in axes[0] for j in axes[1] for k in axes[2]])
+
+def supercell_size(lattice, cutoff):
+    """
+    return: np.array[int] | smallest (A, B, C) replication for which cutoff
+                            is at most half of every perpendicular width
+    parameters:
+        lattice: Lattice
+        cutoff: float | cartesian cutoff radius
+    """
+    widths = lattice.perpendicular_widths()
+    return np.maximum(1, np.ceil(2.0 * cutoff / widths)).astype(int)
+
+def image_pairs(positions1, positions2, cutoff, lattice, half=False):
+    """
+    Virtual supercell: finds all pairs within cutoff over every periodic
+    image, without replicating the atoms, for cells smaller than twice
+    the cutoff. Each image within cutoff is its own pair, so the same
+    indices can repeat and an atom can pair with its own images.
+
+    return: tuple(np.array[int], np.array[int], np.array[float])
+            | indices into positions1 and positions2 and cartesian
+              distance of each pair image, sorted by index
+    parameters:
+        positions1: np.array[float] | (N, 3) reduced coordinates
+        positions2: np.array[float] | (M, 3) reduced coordinates
+        cutoff: float | cartesian cutoff radius
+        lattice: Lattice
+        half: bool | positions1 and positions2 are the same atoms, only
+                     return each pair image once
+    """
+    positions1 = np.asarray(positions1, dtype=float).reshape(-1, 3)
+    positions2 = np.asarray(positions2, dtype=float).reshape(-1, 3)
+    matrix = lattice.get_matrix()
+    widths = lattice.perpendicular_widths()
+
+    # minimum image differences are within half a cell of the origin
+    nimages = np.ceil(cutoff / widths + 0.5).astype(int)
+    translations = np.array([[i, j, k] for i in xrange(-nimages[0], nimages[0]+1)
+                                       for j in xrange(-nimages[1], nimages[1]+1)
+                                       for k in xrange(-nimages[2], nimages[2]+1)])
+    shifts = np.dot(translations, matrix)
+    # an atom and its own image at +t and -t are one pair: translations
+    # are in lexicographic order, so keep those after the zero translation
+    positive = np.arange(len(translations)) > len(translations) // 2
+
+    idx1, idx2, distances = [], [], []
+    nrows = max(1, _PBC_BLOCK_BYTES // (24 * max(1, len(positions2))))
+    j = np.arange(len(positions2))
+    for start in xrange(0, len(positions1), nrows):
+        diff = positions1[start:start+nrows,np.newaxis] - positions2[np.newaxis]
+        diff -= np.round(diff)
+        cartesian = np.dot(diff, matrix)
+        i = np.arange(start, start + len(diff))[:,np.newaxis]
+        instrument.count('utils.pairs_evaluated', diff.shape[0] * diff.shape[1] * len(shifts))
+        for shift, is_positive in zip(shifts, positive):
+            d = np.sqrt(np.sum((cartesian + shift)**2, axis=2))
+            within = d <= cutoff
+            if half:
+                within &= (i < j) | ((i == j) & is_positive)
+            rows, cols = np.nonzero(within)
+            idx1.append(rows + start)
+            idx2.append(cols)
+            distances.append(d[rows, cols])
+
+    if not idx1:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    idx1 = np.concatenate(idx1)
+    idx2 = np.concatenate(idx2)
+    distances = np.concatenate(distances)
+    order = np.lexsort((idx2, idx1))
+    return idx1[order], idx2[order], distances[order]
+
+def cell_list_pairs(positions1, positions2, cutoff, lattice, half=False):
+    """
+    Finds all pairs within cutoff using a periodic cell list binned on
+    reduced coordinates, in O(N) time and memory (the grid is capped at
+    about one cell per atom, so dilute systems do not allocate a cell
+    per cutoff volume). Cutoffs over
+    half the shortest perpendicular cell width go to image_pairs.
+
+    return: tuple(np.array[int], np.array[int], np.array[float])
+            | indices into positions1 and positions2 and cartesian
+              minimum image distance of each pair, sorted by index
+    parameters:
+        positions1: np.array[float] | (N, 3) reduced coordinates
+        positions2: np.array[float] | (M, 3) reduced coordinates
+        cutoff: float | cartesian cutoff radius
+        lattice: Lattice
+        half: bool | positions1 and positions2 are the same atoms, only
+                     return pairs with index1 < index2
+    """
+    positions1 = np.asarray(positions1, dtype=float).reshape(-1, 3)
+    positions2 = np.asarray(positions2, dtype=float).reshape(-1, 3)
+    matrix = lattice.get_matrix()
+    widths = lattice.perpendicular_widths()
+    if cutoff > 0.5 * np.min(widths):
+        return image_pairs(positions1, positions2, cutoff, lattice, half)
+
+    # cells are at least cutoff wide, so pairs lie in neighbouring cells;
+    # dilute systems get wider cells, keeping the grid to about one cell
+    # per atom so that time and memory follow N rather than the volume
+    ncells = np.maximum(1, np.floor(widths / cutoff))
+    nmax = max(1, len(positions2))
+    while np.prod(ncells) > nmax:
+        scale = (np.prod(ncells) / nmax)**(1.0 / np.count_nonzero(ncells > 1))
+        ncells = np.maximum(1, np.floor(ncells / scale))
+    ncells = ncells.astype(int)
+    wrapped1 = positions1 - np.floor(positions1)
+    wrapped2 = positions2 - np.floor(positions2)
+    cells1 = np.minimum((wrapped1 * ncells).astype(int), ncells - 1)
+    cells2 = np.minimum((wrapped2 * ncells).astype(int), ncells - 1)
+
+    # sort positions2 by flat cell index
+    flat2 = np.ravel_multi_index(cells2.T, ncells)
+    order = np.argsort(flat2, kind='mergesort')
+    counts = np.bincount(flat2, minlength=np.prod(ncells))
+    starts = np.cumsum(counts) - counts
+
+    idx1, idx2, distances = [], [], []
+    for offset in _cell_offsets(ncells):
+        neighbor = np.ravel_multi_index(((cells1 + offset) % ncells).T, ncells)
+        ncandidates = counts[neighbor]
+        i = np.repeat(np.arange(len(positions1)), ncandidates)
+        first = np.repeat(starts[neighbor] - (np.cumsum(ncandidates) - ncandidates)
+                         ,ncandidates)
+        j = order[first + np.arange(len(i))]
+        if half:
+            i, j = i[i < j], j[i < j]
+        instrument.count('utils.pairs_evaluated', len(i))
+
+        # within cutoff, |reduced difference| <= cutoff / width <= 0.5
+        diff = wrapped1[i] - wrapped2[j]
+        diff -= np.round(diff)
+        cartesian = np.dot(diff, matrix)
+        d = np.sqrt(np.einsum('ij,ij->i', cartesian, cartesian))
+        within = d <= cutoff
+        idx1.append(i[within])
+        idx2.append(j[within])
+        distances.append(d[within])
+
+    idx1 = np.concatenate(idx1)
+    idx2 = np.concatenate(idx2)
+    distances = np.concatenate(distances)
+    order = np.lexsort((idx2, idx1))
+    return idx1[order], idx2[order], distances[order]
+
+def unwrap_configurations(configurations):
+    """
+    Destructive: positions of each configuration are unwrapped in place
+
+    Streams configurations, tracking each atom's integer image offsets
+    from one configuration to the next, so that no atom moves more
+    than half a lattice vector between consecutive configurations.
+    Offsets are in reduced coordinates, so per-configuration lattices
+    of variable cell runs are handled.
+
+    return: iterator[Configuration] | unwrapped configurations
+    parameters:
+        configurations: iterable[Configuration] | consecutive in time
+    """
+    previous, images = None, None
+    for configuration in configurations:
+        positions = configuration.get_positions()
+        wrapped = positions - np.floor(positions)
+        if previous is None:
+            images = np.floor(positions).astype(int)
+        elif previous.shape != wrapped.shape:
+            raise ValueError, 'all configurations must have the same atoms'
+        else:
+            images -= np.round(wrapped - previous).astype(int)
+        configuration.set_positions(wrapped + images)
+        previous = wrapped
+        yield configuration
+
+def unwrap_positions(positions):
+    """
+    Array version of unwrap_configurations
+
+    return: np.array[float] | (F, N, 3) unwrapped reduced coordinates
+    parameters:
+        positions: np.array[float] | (F, N, 3) reduced coordinates,
+                                     consecutive in time
+    """
+    positions = np.asarray(positions, dtype=float)
+    steps = np.diff(positions, axis=0)
+    steps -= np.round(steps)
+    unwrapped = np.empty_like(positions)
+    unwrapped[0] = positions[0]
+    np.cumsum(steps, axis=0, out=unwrapped[1:])
+    unwrapped[1:] += positions[0]
+    return unwrapped
+
+def autocorrelation_fft(x):
+    """
+    Autocorrelation along the first axis from zero-padded FFTs, in
+    O(F log F) time: acf[m] = sum_k x[k] * x[k+m] / (F - m)
+
+    return: np.array[float] | same shape as x
+    parameters:
+        x: np.array[float] | (F, ...) time series
+    """
+    x = np.asarray(x, dtype=float)
+    nframes = len(x)
+    transform = np.fft.rfft(x, n=2*nframes, axis=0)
+    acf = np.fft.irfft(transform * np.conj(transform), n=2*nframes, axis=0)[:nframes]
+    lags = nframes - np.arange(nframes)
+    return acf / lags.reshape((nframes,) + (1,) * (x.ndim - 1))
+
+def _apply_to_frames(args):
+    """
+    return: object | function applied to a chunk of configurations
+    parameters:
+        args: tuple | function, list of configurations, extra arguments
+    """
+    function, configurations, extra = args
+    return function(configurations, *extra)
+
+def map_frames(function, configurations, args=(), nprocs=1, chunk_size=16):
+    """
+    Applies function(list[Configuration], *args) to consecutive chunks
+    of configurations, spread over nprocs worker processes. Only nprocs
+    chunks are read ahead at a time, so streamed configurations (e.g.
+    file_tools.iter_trj) are never all held in memory.
+
+    return: iterator | function results in chunk order
+    parameters:
+        function: function | module level, so it can be pickled
+        configurations: iterable[Configuration]
+        args: tuple | extra arguments for function
+        nprocs: int | number of worker processes
+        chunk_size: int | number of configurations per chunk
+    """
+    configurations = iter(configurations)
+    pool = multiprocessing.Pool(nprocs) if nprocs > 1 else None
+    try:
+        while True:
+            chunks = []
+            for i in xrange(max(1, nprocs)):
+                chunk = list(itertools.islice(configurations, chunk_size))
+                if chunk:
+                    chunks.append((function, chunk, args))
+            if not chunks:
+                break
+            if pool:
+                results = pool.map(_apply_to_frames, chunks)
+            else:
+                results = map(_apply_to_frames, chunks)
+            for result in results:
+                yield result
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
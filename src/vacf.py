@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+vacf.py
+Author: Brian Boates
+
+Velocities by finite differences, velocity autocorrelation functions
+and the vibrational density of states
+"""
+import sys
+sys.dont_write_bytecode = True
+import numpy as np
+from utils import unwrap_positions
+from utils import autocorrelation_fft
+
+def velocities_from_positions(positions, lattices, dt):
+    """
+    Central differences of the unwrapped cartesian positions, one-sided
+    at the first and last frame
+
+    return: np.array[float] | (F, N, 3) cartesian velocities
+    parameters:
+        positions: np.array[float] | (F, N, 3) reduced coordinates
+        lattices: np.array[float] | (F, 3, 3) lattice vectors as rows
+        dt: float | time between frames
+    """
+    if len(positions) < 2:
+        raise ValueError, 'at least two frames are needed for velocities'
+    cartesian = np.einsum('fni,fij->fnj', unwrap_positions(positions), lattices)
+    return np.gradient(cartesian, dt, axis=0)
+
+def vacf_fft(velocities):
+    """
+    return: np.array[float] | (F, N) <v(0).v(t)> of each atom over all
+                              time origins, per lag
+    parameters:
+        velocities: np.array[float] | (F, N, 3) cartesian velocities
+    """
+    return np.sum(autocorrelation_fft(velocities), axis=2)
+
+def compute_vacf(positions, lattices, dt, chunk_size=None):
+    """
+    Atoms are processed chunk_size at a time, so positions can be a
+    memory-mapped array larger than RAM
+
+    return: np.array[float] | (F,) VACF summed over the atoms
+    parameters:
+        positions: np.array[float] | (F, N, 3) reduced coordinates
+        lattices: np.array[float] | (F, 3, 3) lattice vectors as rows
+        dt: float | time between frames
+        chunk_size: int | number of atoms per chunk (default: all)
+    """
+    natom = positions.shape[1]
+    chunk_size = chunk_size or max(1, natom)
+    total = np.zeros(len(positions))
+    for start in xrange(0, natom, chunk_size):
+        velocities = velocities_from_positions(positions[:,start:start+chunk_size]
+                                              ,lattices, dt)
+        total += np.sum(vacf_fft(velocities), axis=1)
+    return total
+
+def vdos(vacf, dt):
+    """
+    Cosine transform of the VACF: the spectrum of a VACF normalized to
+    1 at t = 0 integrates to 1 over positive frequencies
+
+    return: tuple(np.array[float], np.array[float]) | frequencies
+                                                     (1 / time units)
+                                                     and density of states
+    parameters:
+        vacf: np.array[float] | (F,) velocity autocorrelation function
+        dt: float | time between frames
+    """
+    symmetric = np.concatenate((vacf, vacf[-2:0:-1]))
+    frequencies = np.fft.rfftfreq(len(symmetric), dt)
+    return frequencies, 2 * dt * np.real(np.fft.rfft(symmetric))